@@ -0,0 +1,28 @@
+from datetime import date, datetime, time, timedelta
+from django.utils import timezone
+
+
+def start_of_day(day):
+    """Medianoche del día indicado en la zona horaria configurada"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def period_days(now=None):
+    """Rangos semiabiertos de fechas [inicio, fin) de día, semana (últimos 7 días), mes y año"""
+    today = timezone.localdate(now)
+    tomorrow = today + timedelta(days=1)
+    month = today.replace(day=1)
+    return {
+        'day': (today, tomorrow),
+        'week': (today - timedelta(days=7), tomorrow),
+        'month': (month, (month + timedelta(days=32)).replace(day=1)),
+        'year': (date(today.year, 1, 1), date(today.year + 1, 1, 1)),
+    }
+
+
+def parse_date(value):
+    """Convierte 'AAAA-MM-DD' en fecha; retorna None si no es válida"""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,145 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+
+def encode_cursor(values):
+    """Codifica los valores de la última fila como un cursor opaco para la URL"""
+    data = json.dumps(values, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decodifica un cursor; retorna None si viene vacío o alterado"""
+    if not cursor:
+        return None
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_filter(fields, values):
+    """Condición que deja sólo las filas posteriores a ``values`` según ``fields``.
+
+    ``fields`` usa la notación de order_by (``'-date'`` es descendente), por
+    ejemplo ``(date, id) < (d, i)`` para ``['-date', '-id']``.
+    """
+    condition = Q()
+    for index, field in enumerate(fields):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[index]})
+        for previous, value in zip(fields[:index], values):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+def keyset_page(queryset, fields, cursor=None, limit=20, reverse=False):
+    """Retorna una página de ``queryset`` ordenada por ``fields`` a partir del cursor.
+
+    Resultado: ``(filas, cursor_siguiente, cursor_anterior)``. Con
+    ``reverse=True`` el cursor se interpreta hacia atrás. Sólo se lee una
+    fila de más para saber si hay otra página; no se hace COUNT(*).
+    """
+    fields = list(fields)
+    values = decode_cursor(cursor)
+    if not isinstance(values, list) or len(values) != len(fields):
+        values = None
+    order = fields
+    if reverse:
+        order = [field[1:] if field.startswith('-') else f'-{field}' for field in fields]
+    rows = None
+    if values is not None:
+        try:
+            rows = list(queryset.filter(keyset_filter(order, values)).order_by(*order)[:limit + 1])
+        except (ValidationError, TypeError, ValueError, OverflowError):
+            # Cursor alterado con valores de otro tipo: se trata como ausente
+            values = None
+    if rows is None:
+        rows = list(queryset.order_by(*order)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if reverse:
+        rows.reverse()
+
+    def cursor_for(row):
+        return encode_cursor([
+            row[field.lstrip('-')] if isinstance(row, dict) else getattr(row, field.lstrip('-'))
+            for field in fields
+        ])
+
+    if not rows:
+        return rows, None, None
+    has_next = has_more if not reverse else True
+    has_previous = (values is not None) if not reverse else has_more
+    return (
+        rows,
+        cursor_for(rows[-1]) if has_next else None,
+        cursor_for(rows[0]) if has_previous else None,
+    )
+
+
+def estimate_count(queryset):
+    """Total aproximado según las estadísticas del planificador de PostgreSQL.
+
+    Ejecuta ``EXPLAIN`` (no recorre la tabla) y lee las filas estimadas del
+    plan. En otros motores retorna None y la plantilla no muestra el total.
+    """
+    db = queryset.db
+    if connections[db].vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CursorPaginationMixin:
+    """Paginación por cursor para ListView en lugar de OFFSET y COUNT(*).
+
+    Define ``cursor_ordering`` (por ejemplo ``['-date', '-id']``, que debe
+    terminar en una columna única) y ``page_size``. El contexto incluye
+    ``next_url``/``previous_url`` conservando los filtros de la URL y,
+    si ``show_approximate_count`` está activo, ``approximate_count``.
+    """
+    cursor_ordering = ['-id']
+    page_size = 10
+    show_approximate_count = True
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    def cursor_url(self, name, cursor):
+        if not cursor:
+            return None
+        params = self.request.GET.copy()
+        for key in ('cursor', 'before', 'page'):
+            params.pop(key, None)
+        params[name] = cursor
+        return f'?{params.urlencode()}'
+
+    def get_context_data(self, **kwargs):
+        queryset = kwargs.pop('object_list', self.object_list)
+        before = self.request.GET.get('before')
+        rows, next_cursor, previous_cursor = keyset_page(
+            queryset,
+            self.get_cursor_ordering(),
+            cursor=before or self.request.GET.get('cursor'),
+            limit=self.page_size,
+            reverse=bool(before),
+        )
+        context = super().get_context_data(object_list=rows, **kwargs)
+        context.update({
+            'next_url': self.cursor_url('cursor', next_cursor),
+            'previous_url': self.cursor_url('before', previous_cursor),
+            'approximate_count': estimate_count(queryset) if self.show_approximate_count else None,
+        })
+        return context
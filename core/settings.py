@@ -105,6 +105,42 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+def shared_cache(name):
+    """Caché compartido entre workers: Redis si está configurado, si no archivos locales"""
+    if os.getenv('REDIS_URL'):
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'KEY_PREFIX': name,
+        }
+    return {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / name,
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'carts': shared_cache('carts'),
+    'shared': shared_cache('shared'),
+}
+
+CART_CACHE_ALIAS = 'carts'
+
+# Índice de búsqueda de productos en memoria para el punto de venta
+PRODUCT_SEARCH_INDEX = os.getenv('PRODUCT_SEARCH_INDEX') == 'True'
+PRODUCT_SEARCH_CACHE_ALIAS = 'shared'
+
+# Caché de los bloques del dashboard (segundos); se invalida al cambiar
+# ventas o stock y el tiempo de expiración sólo es un respaldo
+DASHBOARD_CACHE_ALIAS = 'shared'
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', 300))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -153,6 +189,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'  
 
+# Cantidad de números de venta que cada worker reserva de una vez (1 = sin bloques)
+SALE_NUMBER_BLOCK_SIZE = int(os.getenv('SALE_NUMBER_BLOCK_SIZE', 1))
+
 LOGIN_URL = 'users:login'  
 LOGIN_REDIRECT_URL = 'dashboard:index'
 LOGOUT_REDIRECT_URL = 'users:login'  
\ No newline at end of file
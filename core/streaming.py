@@ -0,0 +1,5 @@
+class Echo:
+    """Buffer que devuelve lo escrito, para que csv.writer produzca líneas sueltas"""
+
+    def write(self, value):
+        return value
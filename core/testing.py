@@ -0,0 +1,8 @@
+from django.conf import settings
+
+# Cachés en memoria para las pruebas: los de archivo (BASE_DIR/cache) o
+# Redis se comparten con el servidor de desarrollo y no deben escribirse
+LOCMEM_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'tests-{alias}'}
+    for alias in settings.CACHES
+}
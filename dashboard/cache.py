@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# Grupos de bloques que se invalidan juntos
+SALES = 'sales'
+STOCK = 'stock'
+
+VERSION_KEY = 'dashboard:{scope}:version'
+
+
+def dashboard_cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def version(scope):
+    return dashboard_cache().get(VERSION_KEY.format(scope=scope), 0)
+
+
+def mark_stale(scope):
+    """Invalida en todos los workers los bloques del grupo subiendo su versión"""
+    cache = dashboard_cache()
+    key = VERSION_KEY.format(scope=scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # La clave no existe todavía (o expiró)
+        cache.add(key, 1, None)
+        cache.incr(key)
+
+
+def changed(*scopes):
+    """Invalida los grupos indicados cuando la transacción actual se confirme"""
+    for scope in scopes:
+        transaction.on_commit(lambda scope=scope: mark_stale(scope))
+
+
+def get_periods(block, scope, day, periods, compute, refresh=False):
+    """Lee del caché un bloque guardado por período, o lo calcula completo.
+
+    Cada período se guarda en su propia clave, que incluye la versión del
+    grupo y el día local (los períodos cambian al pasar la medianoche).
+    ``compute`` retorna ``{período: valor}`` para todos los períodos.
+    """
+    cache = dashboard_cache()
+    prefix = f'dashboard:{block}:{version(scope)}:{day.isoformat()}'
+    keys = {period: f'{prefix}:{period}' for period in periods}
+    if not refresh:
+        cached = cache.get_many(keys.values())
+        if len(cached) == len(keys):
+            return {period: cached[key] for period, key in keys.items()}
+    values = compute()
+    cache.set_many({keys[period]: value for period, value in values.items()}, timeout())
+    return values
+
+
+def get_block(block, scope, day, compute, refresh=False):
+    """Igual que get_periods() para un bloque que no depende del período"""
+    return get_periods(block, scope, day, ['all'], lambda: {'all': compute()}, refresh)['all']
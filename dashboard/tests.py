@@ -1,3 +1,117 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from core.dates import period_days
+from core.testing import LOCMEM_CACHES
+from dashboard.cache import dashboard_cache
+from products.models import Category, Product
+from sales.models import DailySalesRollup, Sale, SaleDetail, format_sale_number
+from sales.services import transition_sale
 
-# Create your tests here.
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DashboardViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('admin', password='clave')
+        category = Category.objects.create(name='General')
+        cls.products = Product.objects.bulk_create([
+            Product(
+                name=f'Producto {index}', brand='Marca', category=category,
+                purchase_price=500, sale_price=1000, stock=10 + index
+            )
+            for index in range(4)
+        ])
+
+        now = timezone.now()
+        # (días atrás, estado, [(producto, cantidad)])
+        cls.seed = [
+            (0, 'COMPLETED', [(0, 2), (1, 1)]),
+            (0, 'PENDING', [(3, 9)]),
+            (3, 'COMPLETED', [(1, 4)]),
+            (20, 'COMPLETED', [(2, 6)]),
+            (200, 'COMPLETED', [(3, 8)]),
+            (400, 'CANCELLED', [(3, 20)]),
+        ]
+        sales = Sale.objects.bulk_create([
+            Sale(
+                number=format_sale_number(index + 1), user=cls.user, payment_method='CASH',
+                status=status, total=sum(quantity * 1000 for _, quantity in lines),
+                is_stock_deducted=status == 'COMPLETED'
+            )
+            for index, (_, status, lines) in enumerate(cls.seed)
+        ])
+        for sale, (days, _, _) in zip(sales, cls.seed):
+            sale.date = now - timedelta(days=days)
+        Sale.objects.bulk_update(sales, ['date'])
+        SaleDetail.objects.bulk_create([
+            SaleDetail(
+                sale=sale, product=cls.products[product], quantity=quantity,
+                unit_price=1000, purchase_price=500, subtotal=quantity * 1000
+            )
+            for sale, (_, _, lines) in zip(sales, cls.seed)
+            for product, quantity in lines
+        ])
+        cls.sales = sales
+        today = timezone.localdate(now)
+        DailySalesRollup.objects.rebuild(today - timedelta(days=400), today + timedelta(days=1))
+
+    def setUp(self):
+        dashboard_cache().clear()
+
+    def expected(self):
+        """Totales y producto más vendido calculados en Python a partir de la semilla"""
+        totals = {}
+        top = {}
+        for period, (start, end) in period_days().items():
+            units = {}
+            totals[period] = 0
+            for sale, (_, status, lines) in zip(self.sales, self.seed):
+                if status != 'COMPLETED' or not start <= timezone.localdate(sale.date) < end:
+                    continue
+                totals[period] += sale.total
+                for product, quantity in lines:
+                    units[product] = units.get(product, 0) + quantity
+            if units:
+                product = max(units, key=units.get)
+                top[period] = {
+                    'product__name': self.products[product].name,
+                    'total_quantity': units[product],
+                }
+            else:
+                top[period] = None
+        return totals, top
+
+    def test_dashboard_runs_fixed_number_of_queries(self):
+        self.client.force_login(self.user)
+        # sesión, usuario, totales, más vendidos, rentabilidad y stock bajo
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('dashboard:index'))
+        self.assertEqual(response.status_code, 200)
+
+        totals, top = self.expected()
+        self.assertEqual(response.context['sales_summary'], totals)
+        self.assertEqual(response.context['top_products'], top)
+
+    def test_dashboard_is_cached_until_a_sale_changes(self):
+        self.client.force_login(self.user)
+        url = reverse('dashboard:index')
+        self.client.get(url)
+        # Con el caché lleno sólo quedan las consultas de sesión y usuario
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        totals, _ = self.expected()
+        self.assertEqual(response.context['sales_summary'], totals)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_sale(self.sales[0].pk, 'CANCELLED')
+        response = self.client.get(url)
+        self.assertEqual(
+            response.context['sales_summary']['day'],
+            totals['day'] - self.sales[0].total
+        )
+        # La anulación devolvió stock: el bloque de stock bajo también se recalculó
+        stock = {product.pk: product.stock for product in response.context['low_stock_products']}
+        self.assertEqual(stock[self.products[0].pk], self.products[0].stock + 2)
@@ -1,92 +1,116 @@
 # views.py
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Sum, Count
-from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear
+from django.db.models import F, Q, Sum, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
-from sales.models import Sale, SaleDetail
+from core.dates import period_days
+from sales.models import DailySalesRollup
 from products.models import Product
-from django.db.models import Sum, Count, F, ExpressionWrapper, FloatField
-from django.db.models.functions import Cast
+from . import cache
+
+
+def overall_range(periods):
+    """Rango que cubre todos los períodos (la semana puede empezar el año anterior)"""
+    return (
+        min(start for start, _ in periods.values()),
+        max(end for _, end in periods.values()),
+    )
+
+
+def period_totals(periods):
+    """Total de ventas completadas de cada período con agregación condicional"""
+    start, end = overall_range(periods)
+    totals = DailySalesRollup.objects.filter(
+        day__gte=start,
+        day__lt=end
+    ).aggregate(**{
+        f'{period}_total': Sum('gross', filter=Q(day__gte=period_start, day__lt=period_end))
+        for period, (period_start, period_end) in periods.items()
+    })
+    return {period: totals[f'{period}_total'] or 0 for period in periods}
+
+
+def top_products_by_period(periods):
+    """Producto con más unidades vendidas en cada período.
+
+    Agrupa por producto sumando las unidades de cada período por separado
+    y numera las filas de cada suma con ROW_NUMBER(); sólo vuelven los
+    productos que ocupan el primer lugar en algún período.
+    """
+    start, end = overall_range(periods)
+    quantities = {
+        f'{period}_units': Sum('units', filter=Q(day__gte=period_start, day__lt=period_end))
+        for period, (period_start, period_end) in periods.items()
+    }
+    ranks = {
+        f'{period}_rank': Window(
+            RowNumber(),
+            order_by=[F(f'{period}_units').desc(nulls_last=True), F('product_id').asc()]
+        )
+        for period in periods
+    }
+    first_places = Q()
+    for rank in ranks:
+        first_places |= Q(**{rank: 1})
+
+    rows = DailySalesRollup.objects.filter(
+        day__gte=start,
+        day__lt=end
+    ).values('product_id', 'product__name').annotate(**quantities).annotate(**ranks).filter(first_places)
+
+    top = dict.fromkeys(periods)
+    for row in rows:
+        for period in periods:
+            units = row[f'{period}_units']
+            if row[f'{period}_rank'] == 1 and units:
+                top[period] = {'product__name': row['product__name'], 'total_quantity': units}
+    return top
+
+
+def top_profitable_products():
+    """Top 5 productos con mejor rentabilidad"""
+    return list(DailySalesRollup.objects.values('product__name').annotate(
+        total_profit=Sum('net_profit')
+    ).order_by('-total_profit')[:5])
+
+
+def low_stock_products():
+    """Top 5 productos activos con stock más bajo"""
+    return list(Product.objects.filter(
+        is_active=True,
+        stock__gt=0  # Solo productos con stock mayor a 0
+    ).order_by('stock')[:5])
+
+
+def dashboard_blocks(refresh=False):
+    """Bloques del dashboard, leídos del caché o recalculados.
+
+    Los bloques de ventas se invalidan cuando cambia el resumen diario y
+    el de stock bajo cuando cambia el stock (ver dashboard.cache).
+    """
+    day = timezone.localdate()
+    periods = period_days()
+    return {
+        'sales_summary': cache.get_periods(
+            'sales_summary', cache.SALES, day, periods, lambda: period_totals(periods), refresh
+        ),
+        'top_products': cache.get_periods(
+            'top_products', cache.SALES, day, periods, lambda: top_products_by_period(periods), refresh
+        ),
+        'top_profitable_products': cache.get_block(
+            'top_profitable_products', cache.SALES, day, top_profitable_products, refresh
+        ),
+        'low_stock_products': cache.get_block(
+            'low_stock_products', cache.STOCK, day, low_stock_products, refresh
+        ),
+    }
+
 
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'dashboard/index.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        # Obtener la fecha actual
-        now = timezone.now()
-        
-        # 1. Total ventas por período
-        context['sales_summary'] = {
-            'day': Sale.objects.filter(
-                date__date=now.date(),
-                status='COMPLETED'
-            ).aggregate(total=Sum('total'))['total'] or 0,
-            
-            'week': Sale.objects.filter(
-                date__date__gte=now.date() - timezone.timedelta(days=7),
-                status='COMPLETED'
-            ).aggregate(total=Sum('total'))['total'] or 0,
-            
-            'month': Sale.objects.filter(
-                date__year=now.year,
-                date__month=now.month,
-                status='COMPLETED'
-            ).aggregate(total=Sum('total'))['total'] or 0,
-            
-            'year': Sale.objects.filter(
-                date__year=now.year,
-                status='COMPLETED'
-            ).aggregate(total=Sum('total'))['total'] or 0,
-        }
-        
-        # 2. Producto más vendido por período
-        context['top_products'] = {
-            'day': SaleDetail.objects.filter(
-                sale__date__date=now.date(),
-                sale__status='COMPLETED'
-            ).values('product__name').annotate(
-                total_quantity=Sum('quantity')
-            ).order_by('-total_quantity').first(),
-            
-            'week': SaleDetail.objects.filter(
-                sale__date__date__gte=now.date() - timezone.timedelta(days=7),
-                sale__status='COMPLETED'
-            ).values('product__name').annotate(
-                total_quantity=Sum('quantity')
-            ).order_by('-total_quantity').first(),
-            
-            'month': SaleDetail.objects.filter(
-                sale__date__year=now.year,
-                sale__date__month=now.month,
-                sale__status='COMPLETED'
-            ).values('product__name').annotate(
-                total_quantity=Sum('quantity')
-            ).order_by('-total_quantity').first(),
-            
-            'year': SaleDetail.objects.filter(
-                sale__date__year=now.year,
-                sale__status='COMPLETED'
-            ).values('product__name').annotate(
-                total_quantity=Sum('quantity')
-            ).order_by('-total_quantity').first(),
-        }
-        
-        # 3. Top 5 productos con mejor rentabilidad
-        context['top_profitable_products'] = SaleDetail.objects.filter(
-            sale__status='COMPLETED'
-        ).values('product__name').annotate(
-            total_profit=Sum(
-                (F('unit_price') - F('purchase_price')) * F('quantity')
-            )
-        ).order_by('-total_profit')[:5]
-
-        # 4. Top 5 productos con stock más bajo (que estén activos)
-        context['low_stock_products'] = Product.objects.filter(
-            is_active=True,
-            stock__gt=0  # Solo productos con stock mayor a 0
-        ).order_by('stock')[:5]
-
-        return context
\ No newline at end of file
+        context.update(dashboard_blocks())
+        return context
@@ -1,5 +1,18 @@
-from django.contrib import admin
-from .models import Product, Category
+import io
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .catalog_import import REQUIRED_COLUMNS, OPTIONAL_COLUMNS, import_catalog
+from .forms import CatalogImportForm, ProductChangeListForm, ProductEditForm, StocktakeAdminForm
+from .models import Product, Category, StockMovement, StockSnapshot, Stocktake, StocktakeLine
+from .stocktake import apply_stocktake, load_counts, stream_report, variance_summary
+
+# Errores de importación que se muestran en el admin (el resto se resume)
+MAX_IMPORT_MESSAGES = 20
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -8,8 +21,214 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'brand', 'category', 'stock', 'sale_price', 'is_active']
+    list_display = ['name', 'brand', 'barcode', 'category', 'stock', 'sale_price', 'margin', 'is_active']
     list_filter = ['category', 'is_active']
-    search_fields = ['name', 'brand']
+    search_fields = ['name', 'brand', 'barcode']
     list_editable = ['stock', 'is_active']
-    readonly_fields = ['created', 'updated']
\ No newline at end of file
+    readonly_fields = ['created', 'updated', 'version']
+    form = ProductEditForm
+    change_list_template = 'admin/products/product/change_list.html'
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', ProductChangeListForm)
+        return super().get_changelist_form(request, **kwargs)
+
+    def changelist_view(self, request, extra_context=None):
+        # El listado editable valida fuera de la transacción del admin: así
+        # las filas que bloquea ProductEditForm.clean() siguen bloqueadas al guardar
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            return super().changelist_view(request, extra_context)
+
+    def save_model(self, request, obj, form, change):
+        """Al editar, sólo los campos modificados y el stock como ajuste relativo.
+
+        Los conflictos ya se informaron como errores del formulario en
+        clean(); la fila sigue bloqueada, así que aquí no puede haber otro.
+        """
+        if not change:
+            return super().save_model(request, obj, form, change)
+        form.save_changes(request.user)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('category').with_margin()
+
+    @admin.display(description="Ganancia %", ordering='margin_percentage')
+    def margin(self, obj):
+        return f"{obj.margin_percentage}%"
+
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='products_product_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        """Carga del catálogo desde un CSV (ver products.catalog_import)"""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            return redirect('admin:products_product_changelist')
+
+        form = CatalogImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            lines = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_catalog(lines, form.cleaned_data['delimiter'])
+            except (ValidationError, UnicodeDecodeError) as e:
+                message = ' '.join(e.messages) if isinstance(e, ValidationError) else "El archivo debe estar en UTF-8"
+                self.message_user(request, message, messages.ERROR)
+            else:
+                self.message_user(
+                    request,
+                    f"{result.created} producto(s) creado(s), {result.updated} actualizado(s).",
+                    messages.SUCCESS
+                )
+                for error in result.errors[:MAX_IMPORT_MESSAGES]:
+                    self.message_user(
+                        request,
+                        f"Línea {error['line']} ({error['barcode'] or 'sin código'}): {error['reason']}",
+                        messages.WARNING
+                    )
+                if len(result.errors) > MAX_IMPORT_MESSAGES:
+                    self.message_user(
+                        request,
+                        f"... y {len(result.errors) - MAX_IMPORT_MESSAGES} fila(s) más con errores.",
+                        messages.WARNING
+                    )
+                return redirect('admin:products_product_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Importar productos desde CSV",
+            'form': form,
+            'required_columns': REQUIRED_COLUMNS,
+            'optional_columns': OPTIONAL_COLUMNS,
+        }
+        return TemplateResponse(request, 'admin/products/product/import.html', context)
+
+
+@admin.register(Stocktake)
+class StocktakeAdmin(admin.ModelAdmin):
+    form = StocktakeAdminForm
+    list_display = ['name', 'status', 'user', 'created', 'applied']
+    list_filter = ['status']
+    readonly_fields = ['status', 'user', 'created', 'applied', 'summary']
+    actions = ['apply_selected', 'download_report']
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj and obj.status != 'OPEN':
+            return [*self.readonly_fields, 'name']
+        return self.readonly_fields
+
+    def get_fields(self, request, obj=None):
+        fields = ['name', 'status', 'user', 'created', 'applied']
+        if obj:
+            fields.append('summary')
+        if obj is None or obj.status == 'OPEN':
+            fields += ['counts_file', 'delimiter']
+        return fields
+
+    @admin.display(description="Diferencias")
+    def summary(self, obj):
+        summary = variance_summary(obj)
+        return (
+            f"{summary['products']} producto(s) contado(s), {summary['differences']} con diferencia: "
+            f"+{summary['units_over']} / {summary['units_short']} unidades, valor neto $ {summary['cost']}"
+        )
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.user = request.user
+        super().save_model(request, obj, form, change)
+        upload = form.cleaned_data.get('counts_file')
+        if not upload:
+            return
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            loaded, errors = load_counts(obj, lines, form.cleaned_data['delimiter'])
+        except (ValidationError, UnicodeDecodeError) as e:
+            message = ' '.join(e.messages) if isinstance(e, ValidationError) else "El archivo debe estar en UTF-8"
+            self.message_user(request, message, messages.ERROR)
+            return
+        self.message_user(request, f"{loaded} producto(s) cargado(s) en la toma.", messages.SUCCESS)
+        for error in errors[:MAX_IMPORT_MESSAGES]:
+            self.message_user(
+                request,
+                f"Línea {error['line']} ({error['code'] or 'sin código'}): {error['reason']}",
+                messages.WARNING
+            )
+        if len(errors) > MAX_IMPORT_MESSAGES:
+            self.message_user(request, f"... y {len(errors) - MAX_IMPORT_MESSAGES} fila(s) más con errores.", messages.WARNING)
+
+    @admin.action(description="Aplicar ajustes de stock de las tomas seleccionadas")
+    def apply_selected(self, request, queryset):
+        for stocktake in queryset.filter(status='OPEN'):
+            adjusted = apply_stocktake(stocktake.pk)
+            self.message_user(request, f"{stocktake}: stock ajustado en {adjusted} producto(s).", messages.SUCCESS)
+
+    @admin.action(description="Descargar reporte de diferencias")
+    def download_report(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Seleccione una sola toma de inventario.", messages.WARNING)
+            return None
+        stocktake = queryset.get()
+        response = StreamingHttpResponse(stream_report(stocktake), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="toma-{stocktake.pk}-diferencias.csv"'
+        return response
+
+
+@admin.register(StocktakeLine)
+class StocktakeLineAdmin(admin.ModelAdmin):
+    list_display = ['product', 'stocktake', 'expected', 'counted', 'variance', 'variance_cost']
+    list_filter = ['stocktake']
+    search_fields = ['product__name', 'product__barcode']
+    list_select_related = ['product', 'stocktake']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_variance()
+
+    @admin.display(description="Diferencia", ordering='variance')
+    def variance(self, obj):
+        return obj.variance
+
+    @admin.display(description="Valor neto", ordering='variance_cost')
+    def variance_cost(self, obj):
+        return obj.variance_cost
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ['created', 'product', 'kind', 'quantity', 'sale', 'stocktake', 'user', 'note']
+    list_filter = ['kind']
+    search_fields = ['product__name', 'product__barcode', 'sale__number']
+    list_select_related = ['product', 'sale', 'stocktake', 'user']
+    date_hierarchy = 'created'
+
+    # El libro sólo admite agregar movimientos desde las operaciones de stock
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['taken', 'product', 'stock']
+    search_fields = ['product__name', 'product__barcode']
+    list_select_related = ['product']
+    date_hierarchy = 'taken'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
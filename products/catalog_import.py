@@ -0,0 +1,211 @@
+import csv
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F
+from .invalidation import products_changed
+from .models import Category, Product, StockMovement, validate_net_prices
+
+# Filas validadas que se escriben por transacción
+IMPORT_CHUNK_SIZE = 1000
+
+REQUIRED_COLUMNS = ('barcode', 'name', 'brand', 'category', 'purchase_price', 'sale_price')
+OPTIONAL_COLUMNS = ('description', 'is_purchase_with_tax', 'is_sale_with_tax', 'stock', 'is_active')
+TAX_FIELDS = ('is_purchase_with_tax', 'is_sale_with_tax')
+
+# Columnas que se actualizan si el código de barras ya existe. El stock
+# sólo se toma del archivo al crear el producto: el catálogo del
+# proveedor no debe pisar el inventario. Las columnas opcionales sólo se
+# actualizan si vienen en el encabezado del archivo.
+UPDATE_FIELDS = [
+    'name', 'brand', 'category', 'description', 'purchase_price',
+    'is_purchase_with_tax', 'sale_price', 'is_sale_with_tax', 'is_active', 'updated',
+]
+
+TRUE_VALUES = {'1', 'si', 'sí', 's', 'true', 'yes', 'y', 'x'}
+FALSE_VALUES = {'0', 'no', 'n', 'false'}
+
+
+def parse_bool(value, default=True):
+    value = (value or '').strip().lower()
+    if not value:
+        return default
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValidationError(f"Valor de sí/no inválido: {value}")
+
+
+def parse_amount(value, label, field):
+    """Entero no negativo que cabe en la columna ``field`` de Product"""
+    try:
+        amount = int((value or '').strip())
+    except ValueError:
+        raise ValidationError(f"{label} inválido: {value}")
+    if amount < 0:
+        raise ValidationError(f"{label} no puede ser negativo")
+    _, max_value = connection.ops.integer_field_range(Product._meta.get_field(field).get_internal_type())
+    if max_value is not None and amount > max_value:
+        raise ValidationError(f"{label} supera el máximo permitido ({max_value})")
+    return amount
+
+
+def parse_text(row, column, max_length, required=True):
+    value = (row.get(column) or '').strip()
+    if required and not value:
+        raise ValidationError(f"Falta el valor de '{column}'")
+    if len(value) > max_length:
+        raise ValidationError(f"'{column}' supera los {max_length} caracteres")
+    return value
+
+
+def parse_row(row):
+    """Valida una fila del CSV y retorna los valores del producto (sin la categoría resuelta).
+
+    Los precios netos se validan al escribir el bloque, cuando se conocen
+    los indicadores de IVA de los productos que ya existen.
+    """
+    values = {
+        'barcode': parse_text(row, 'barcode', Product._meta.get_field('barcode').max_length),
+        'name': parse_text(row, 'name', Product._meta.get_field('name').max_length),
+        'brand': parse_text(row, 'brand', Product._meta.get_field('brand').max_length),
+        'category': parse_text(row, 'category', Category._meta.get_field('name').max_length),
+        'description': (row.get('description') or '').strip(),
+        'purchase_price': parse_amount(row.get('purchase_price'), "Precio de compra", 'purchase_price'),
+        'sale_price': parse_amount(row.get('sale_price'), "Precio de venta", 'sale_price'),
+        'is_purchase_with_tax': parse_bool(row.get('is_purchase_with_tax')),
+        'is_sale_with_tax': parse_bool(row.get('is_sale_with_tax')),
+        'stock': parse_amount(row.get('stock') or '0', "Stock", 'stock'),
+        'is_active': parse_bool(row.get('is_active')),
+    }
+    return values
+
+
+class CatalogImport:
+    """Importa o actualiza productos desde un CSV leído como flujo.
+
+    Cada producto se identifica por su código de barras. Las filas se
+    validan una a una (las inválidas se informan en ``errors`` sin
+    detener la importación) y se escriben por bloques: las categorías
+    nuevas con un bulk_create y los productos con un solo
+    ``INSERT ... ON CONFLICT (barcode) DO UPDATE`` por bloque.
+    """
+
+    def __init__(self, chunk_size=IMPORT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.categories = {}
+        self.seen = {}
+        self.update_fields = UPDATE_FIELDS
+
+    def error(self, line, barcode, reason):
+        self.errors.append({'line': line, 'barcode': barcode, 'reason': reason})
+
+    def run(self, lines, delimiter=','):
+        """Procesa el archivo (cualquier iterable de líneas de texto)"""
+        reader = csv.DictReader(lines, delimiter=delimiter)
+        columns = {(column or '').strip() for column in reader.fieldnames or []}
+        missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise ValidationError(f"Faltan columnas obligatorias: {', '.join(missing)}")
+        self.update_fields = [
+            field for field in UPDATE_FIELDS if field not in OPTIONAL_COLUMNS or field in columns
+        ]
+
+        self.categories = {name.lower(): pk for pk, name in Category.objects.values_list('pk', 'name')}
+        chunk = []
+        for row in reader:
+            row = {(key or '').strip(): value for key, value in row.items()}
+            line = reader.line_num
+            barcode = (row.get('barcode') or '').strip()
+            try:
+                values = parse_row(row)
+            except ValidationError as e:
+                self.error(line, barcode, ' '.join(e.messages))
+                continue
+            if barcode in self.seen:
+                self.error(line, barcode, f"Código repetido (ya informado en la línea {self.seen[barcode]})")
+                continue
+            self.seen[barcode] = line
+            chunk.append(values)
+            if len(chunk) >= self.chunk_size:
+                self.write(chunk)
+                chunk = []
+        if chunk:
+            self.write(chunk)
+        self.errors.sort(key=lambda error: error['line'])
+        return self
+
+    def validate_prices(self, values, current):
+        """Valida los precios netos con los indicadores de IVA que quedarán en el producto.
+
+        ``current`` son los indicadores de un producto existente: si el
+        archivo no trae esas columnas, el producto conserva los suyos.
+        """
+        flags = {field: values[field] for field in TAX_FIELDS}
+        if current:
+            flags.update({field: value for field, value in current.items() if field not in self.update_fields})
+        validate_net_prices(
+            values['purchase_price'], flags['is_purchase_with_tax'],
+            values['sale_price'], flags['is_sale_with_tax'],
+        )
+
+    def write(self, chunk):
+        with transaction.atomic():
+            barcodes = [values['barcode'] for values in chunk]
+            current = {
+                barcode: dict(zip(TAX_FIELDS, flags))
+                for barcode, *flags in Product.objects.filter(barcode__in=barcodes).values_list('barcode', *TAX_FIELDS)
+            }
+            valid = []
+            for values in chunk:
+                try:
+                    self.validate_prices(values, current.get(values['barcode']))
+                except ValidationError as e:
+                    self.error(self.seen[values['barcode']], values['barcode'], ' '.join(e.messages))
+                    continue
+                valid.append(values)
+            if not valid:
+                return
+
+            new_categories = {}
+            for values in valid:
+                key = values['category'].lower()
+                if key not in self.categories:
+                    new_categories.setdefault(key, Category(name=values['category']))
+            if new_categories:
+                for category in Category.objects.bulk_create(new_categories.values()):
+                    self.categories[category.name.lower()] = category.pk
+
+            products = []
+            for values in valid:
+                values = dict(values)
+                values['category_id'] = self.categories[values.pop('category').lower()]
+                products.append(Product(**values))
+            existing = {product.barcode for product in products if product.barcode in current}
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['barcode'],
+                update_fields=self.update_fields,
+            )
+            received = [product.barcode for product in products if product.barcode not in existing and product.stock]
+            if received:
+                StockMovement.objects.record(
+                    dict(Product.objects.filter(barcode__in=received).values_list('pk', 'stock')),
+                    'RECEIPT', note="Stock inicial (importación de catálogo)",
+                )
+            if existing:
+                # Los formularios abiertos sobre estos productos deben detectar el cambio
+                Product.objects.filter(barcode__in=existing).update(version=F('version') + 1)
+            self.created += len(products) - len(existing)
+            self.updated += len(existing)
+            # bulk_create no emite señales
+            products_changed()
+
+
+def import_catalog(lines, delimiter=',', chunk_size=IMPORT_CHUNK_SIZE):
+    """Importa el catálogo y retorna el resultado con ``created``, ``updated`` y ``errors``"""
+    return CatalogImport(chunk_size).run(lines, delimiter)
@@ -1,10 +1,103 @@
 from django import forms
-from .models import Product
+from django.db import transaction
+from .models import Product, Stocktake, validate_net_prices
+from .services import CONFLICT_MESSAGE, update_product
 
-class ProductForm(forms.ModelForm):
+
+class ProductEditForm(forms.ModelForm):
+    """Base de los formularios que editan productos: recuerda la versión y el stock mostrados.
+
+    Al guardar un producto existente se escriben sólo los campos
+    modificados y el stock se ajusta en la diferencia entre lo que el
+    usuario ingresó y lo que vio (que viaja oculto junto al campo), sin
+    pisar las ventas hechas mientras tanto (ver ``update_product``).
+    """
+    loaded_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    TRACKING_FIELDS = ('loaded_version', 'stock')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['loaded_version'].initial = self.instance.version
+            if 'stock' in self.fields:
+                self.fields['stock'].show_hidden_initial = True
+
+    def submitted_stock(self, shown=False):
+        """Stock enviado, o el que tenía el formulario al mostrarse si ``shown``"""
+        field = self.fields['stock']
+        if shown:
+            widget, name = field.hidden_widget(), self.add_initial_prefix('stock')
+        else:
+            widget, name = field.widget, self.add_prefix('stock')
+        try:
+            return field.to_python(widget.value_from_datadict(self.data, self.files, name))
+        except forms.ValidationError:
+            return None
+
+    def changed_fields(self):
+        """Campos modificados por el usuario, sin contar el stock"""
+        return [name for name in self.changed_data if name not in self.TRACKING_FIELDS]
+
+    def stock_delta(self):
+        """Diferencia entre el stock ingresado y el que tenía el formulario al mostrarse"""
+        if not self.is_bound or not self.instance.pk or 'stock' not in self.fields:
+            return 0
+        stock = self.submitted_stock()
+        if stock is None:
+            return 0
+        shown = self.submitted_stock(shown=True)
+        return stock - (self.instance.stock if shown is None else shown)
+
+    def has_changed(self):
+        if not self.instance.pk:
+            return super().has_changed()
+        return bool(self.changed_fields() or self.stock_delta())
+
+    def current_state(self):
+        """Versión y stock actuales del producto.
+
+        Dentro de una transacción la fila queda bloqueada hasta guardar,
+        de modo que lo validado en clean() sigue vigente en save_changes().
+        """
+        rows = Product.objects.filter(pk=self.instance.pk)
+        if transaction.get_connection().in_atomic_block:
+            rows = rows.select_for_update()
+        return rows.values('version', 'stock').first()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.instance.pk and not self.errors and self.has_changed():
+            current = self.current_state()
+            version = cleaned_data.get('loaded_version')
+            if current is None or version is not None and version != current['version']:
+                raise forms.ValidationError(CONFLICT_MESSAGE)
+            if current['stock'] + self.stock_delta() < 0:
+                self.add_error('stock', f"El stock actual es {current['stock']}; no puede quedar negativo")
+        return cleaned_data
+
+    def save_changes(self, user=None):
+        """Guarda un producto existente con update_product()"""
+        return update_product(
+            self.instance, self.changed_fields(), self.cleaned_data.get('loaded_version'),
+            stock_delta=self.stock_delta(), user=user,
+        )
+
+
+class ProductChangeListForm(ProductEditForm):
+    """Edición en el listado del admin: compara cada campo con el valor mostrado, no con el actual"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            if name != 'loaded_version':
+                field.show_hidden_initial = True
+
+
+class ProductForm(ProductEditForm):
     class Meta:
         model = Product
-        fields = ['name', 'brand', 'category', 'description', 'purchase_price', 
+        fields = ['name', 'brand', 'barcode', 'category', 'description', 'purchase_price', 
                  'is_purchase_with_tax', 'sale_price', 'is_sale_with_tax', 
                  'stock', 'image', 'is_active']
 
@@ -20,6 +113,10 @@ class ProductForm(forms.ModelForm):
             elif isinstance(field.widget, forms.CheckboxInput):
                 field.widget.attrs['class'] = 'rounded border-gray-300 text-blue-600 focus:ring-blue-500'
 
+    def clean_barcode(self):
+        # Sin código se guarda NULL para no chocar con el índice único
+        return (self.cleaned_data.get('barcode') or '').strip() or None
+
     def clean(self):
         cleaned_data = super().clean()
         purchase_price = cleaned_data.get('purchase_price')
@@ -27,13 +124,34 @@ class ProductForm(forms.ModelForm):
         is_purchase_with_tax = cleaned_data.get('is_purchase_with_tax')
         is_sale_with_tax = cleaned_data.get('is_sale_with_tax')
 
-        # Convertir precios a neto si incluyen IVA
-        purchase_net = int(purchase_price / 1.19) if is_purchase_with_tax else purchase_price
-        sale_net = int(sale_price / 1.19) if is_sale_with_tax else sale_price
+        # Misma regla que la importación masiva (products.catalog_import)
+        if purchase_price is not None and sale_price is not None:
+            validate_net_prices(purchase_price, is_purchase_with_tax, sale_price, is_sale_with_tax)
+
+        return cleaned_data
+
 
-        if purchase_net and sale_net and sale_net <= purchase_net:
-            raise forms.ValidationError(
-                "El precio de venta neto debe ser mayor al precio de compra neto."
-            )
+class CatalogImportForm(forms.Form):
+    file = forms.FileField(label="Archivo CSV")
+    delimiter = forms.ChoiceField(
+        label="Separador",
+        choices=[(',', 'Coma (,)'), (';', 'Punto y coma (;)'), ('\t', 'Tabulador')],
+        initial=','
+    )
 
-        return cleaned_data
\ No newline at end of file
+
+class StocktakeAdminForm(forms.ModelForm):
+    counts_file = forms.FileField(
+        label="Archivo de conteo (CSV)",
+        required=False,
+        help_text="Columnas: barcode o product_id, y counted. Los productos repetidos se suman."
+    )
+    delimiter = forms.ChoiceField(
+        label="Separador",
+        choices=[(',', 'Coma (,)'), (';', 'Punto y coma (;)'), ('\t', 'Tabulador')],
+        initial=','
+    )
+
+    class Meta:
+        model = Stocktake
+        fields = ['name']
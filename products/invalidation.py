@@ -0,0 +1,17 @@
+from django.db import transaction
+from dashboard import cache as dashboard_cache
+from . import search_index
+
+
+def products_changed(*scopes, search=True):
+    """Invalida, al confirmar, el buscador y los bloques del dashboard afectados.
+
+    Los UPDATE masivos y bulk_create no emiten señales, así que quien los
+    ejecuta llama a esta función. ``scopes`` son los grupos del dashboard
+    (por defecto stock y ventas); con ``search=False`` el índice de
+    búsqueda se conserva.
+    """
+    if search and search_index.is_enabled():
+        # Tras confirmar, para que ningún worker reconstruya con datos sin confirmar
+        transaction.on_commit(search_index.mark_stale)
+    dashboard_cache.changed(*(scopes or (dashboard_cache.STOCK, dashboard_cache.SALES)))
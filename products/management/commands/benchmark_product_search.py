@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from products import search
+from products.models import Product
+from products.search_index import ProductSearchIndex, normalize
+
+
+class Command(BaseCommand):
+    help = "Compara la búsqueda de productos por SQL con el índice en memoria"
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*', default=['co', 'cola', 'agua min', 'pan'])
+        parser.add_argument('--repeat', type=int, default=200, help="Búsquedas por término")
+
+    def handle(self, *args, **options):
+        terms = options['terms']
+        repeat = options['repeat']
+        queryset = Product.objects.filter(is_active=True, stock__gt=0)
+
+        index = ProductSearchIndex()
+        started = time.perf_counter()
+        snapshot = index.build(index.current_version())
+        build_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(f"Construcción del índice: {build_ms:.1f} ms ({len(snapshot.products)} productos)")
+
+        for term in terms:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(search.search_products(queryset, term).values(*search.SEARCH_FIELDS)[:search.SEARCH_RESULT_LIMIT])
+            sql_us = (time.perf_counter() - started) / repeat * 1_000_000
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                # Sin memo, para medir la búsqueda y no la respuesta memorizada;
+                # el término se normaliza igual que en search()
+                snapshot.find(normalize(term).strip(), search.SEARCH_RESULT_LIMIT)
+            memory_us = (time.perf_counter() - started) / repeat * 1_000_000
+
+            self.stdout.write(
+                f"{term!r}: SQL {sql_us:.0f} µs, memoria {memory_us:.1f} µs "
+                f"({sql_us / memory_us if memory_us else 0:.0f}x)"
+            )
@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ValidationError
+from products.catalog_import import IMPORT_CHUNK_SIZE, REQUIRED_COLUMNS, OPTIONAL_COLUMNS, import_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa o actualiza productos desde un CSV identificándolos por código de barras. "
+        f"Columnas: {', '.join(REQUIRED_COLUMNS)} (obligatorias) y {', '.join(OPTIONAL_COLUMNS)}"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archivo CSV (UTF-8)")
+        parser.add_argument('--delimiter', default=',', help="Separador de columnas")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help="Filas por transacción")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                result = import_catalog(lines, options['delimiter'], max(options['chunk_size'], 1))
+        except OSError as e:
+            raise CommandError(f"No se pudo leer el archivo: {e}")
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
+        for error in result.errors:
+            self.stderr.write(f"Línea {error['line']} ({error['barcode'] or 'sin código'}): {error['reason']}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.created} producto(s) creado(s), {result.updated} actualizado(s), "
+            f"{len(result.errors)} fila(s) con errores en {elapsed:.1f} s"
+        ))
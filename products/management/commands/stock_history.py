@@ -0,0 +1,48 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.dates import parse_date, start_of_day
+from products.models import Product, StockMovement, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = "Muestra los movimientos de stock de un producto en un rango de fechas y su saldo"
+
+    def add_arguments(self, parser):
+        parser.add_argument('product', help="ID o código de barras del producto")
+        parser.add_argument('--date-from', help="Primer día incluido (AAAA-MM-DD); por defecto, hace 7 días")
+        parser.add_argument('--date-to', help="Último día incluido (AAAA-MM-DD); por defecto, hoy")
+
+    def handle(self, *args, **options):
+        product = Product.objects.filter(barcode=options['product']).first()
+        if product is None and options['product'].isdigit():
+            product = Product.objects.filter(pk=options['product']).first()
+        if product is None:
+            raise CommandError("El producto no existe")
+
+        end_day = self.parse_option(options, 'date_to') or timezone.localdate()
+        start_day = self.parse_option(options, 'date_from') or end_day - timedelta(days=7)
+        if start_day > end_day:
+            raise CommandError("La fecha inicial es posterior a la final")
+        start, end = start_of_day(start_day), start_of_day(end_day + timedelta(days=1))
+
+        # Saldo al inicio: instante inmediatamente anterior al rango
+        stock = StockSnapshot.objects.stock_at(product, start - timedelta(microseconds=1))
+        self.stdout.write(f"{product} — stock al {start_day:%d-%m-%Y}: {stock}")
+        for movement in StockMovement.objects.between(product, start, end).select_related('sale', 'stocktake'):
+            stock += movement.quantity
+            reference = movement.sale.number if movement.sale else movement.stocktake or movement.note
+            self.stdout.write(
+                f"{timezone.localtime(movement.created):%d-%m-%Y %H:%M}  {movement.get_kind_display():<20} "
+                f"{movement.quantity:+6}  {stock:6}  {reference}"
+            )
+        self.stdout.write(f"Stock al cierre del {end_day:%d-%m-%Y}: {stock} (actual: {product.stock})")
+
+    def parse_option(self, options, name):
+        value = options[name]
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Fecha inválida para --{name.replace('_', '-')}: {value}")
+        return day
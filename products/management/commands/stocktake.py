@@ -0,0 +1,78 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from products.models import Stocktake
+from products.stocktake import apply_stocktake, load_counts, stream_report, variance_summary
+
+
+class Command(BaseCommand):
+    help = "Toma de inventario: carga conteos desde CSV, informa diferencias y ajusta el stock"
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+
+        load = actions.add_parser('load', help="Carga un CSV con barcode o product_id y counted")
+        load.add_argument('path')
+        load.add_argument('--stocktake', type=int, help="Toma abierta a la que se agregan los conteos")
+        load.add_argument('--name', help="Nombre de la nueva toma")
+        load.add_argument('--delimiter', default=',')
+
+        report = actions.add_parser('report', help="Reporte de diferencias en CSV")
+        report.add_argument('stocktake', type=int)
+        report.add_argument('--output', help="Archivo de salida; por defecto, la salida estándar")
+        report.add_argument('--all', action='store_true', help="Incluye productos sin diferencia")
+
+        apply = actions.add_parser('apply', help="Ajusta el stock con las diferencias de la toma")
+        apply.add_argument('stocktake', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            getattr(self, options['action'])(options)
+        except Stocktake.DoesNotExist:
+            raise CommandError("La toma de inventario no existe")
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
+    def load(self, options):
+        if options['stocktake']:
+            stocktake = Stocktake.objects.get(pk=options['stocktake'])
+        else:
+            name = options['name'] or f"Toma de inventario {timezone.localdate():%d-%m-%Y}"
+            stocktake = Stocktake.objects.create(name=name)
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                loaded, errors = load_counts(stocktake, lines, options['delimiter'])
+        except OSError as e:
+            raise CommandError(f"No se pudo leer el archivo: {e}")
+
+        for error in errors:
+            self.stderr.write(f"Línea {error['line']} ({error['code'] or 'sin código'}): {error['reason']}")
+        self.write_summary(stocktake)
+        self.stdout.write(self.style.SUCCESS(
+            f"Toma #{stocktake.pk}: {loaded} producto(s) cargado(s), {len(errors)} fila(s) con errores"
+        ))
+
+    def report(self, options):
+        stocktake = Stocktake.objects.get(pk=options['stocktake'])
+        chunks = stream_report(stocktake, only_differences=not options['all'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(chunks)
+        self.write_summary(stocktake)
+
+    def apply(self, options):
+        stocktake = Stocktake.objects.get(pk=options['stocktake'])
+        self.write_summary(stocktake)
+        adjusted = apply_stocktake(stocktake.pk)
+        self.stdout.write(self.style.SUCCESS(f"Stock ajustado en {adjusted} producto(s)"))
+
+    def write_summary(self, stocktake):
+        summary = variance_summary(stocktake)
+        self.stderr.write(
+            f"{summary['products']} producto(s) contado(s), {summary['differences']} con diferencia: "
+            f"+{summary['units_over']} / {summary['units_short']} unidades, "
+            f"valor neto {summary['cost']:+}"
+        )
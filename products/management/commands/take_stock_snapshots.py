@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from products.models import SNAPSHOT_BATCH_SIZE, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = "Fotografía el stock de todos los productos a partir del libro de movimientos (ejecutar periódicamente)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SNAPSHOT_BATCH_SIZE, help="Productos por consulta")
+
+    def handle(self, *args, **options):
+        written = StockSnapshot.objects.take(batch_size=max(options['batch_size'], 1))
+        if not written:
+            self.stdout.write("No se escribió ninguna fotografía: ya existe una más reciente o no hay productos")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Fotografía de stock tomada para {written} producto(s)"))
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+INDEXES = (
+    ('products_product_name_trgm', 'name'),
+    ('products_product_brand_trgm', 'brand'),
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    # Índices trigram sólo en PostgreSQL; en otros motores la búsqueda usa LIKE
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON products_product '
+            f'USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_alter_product_options_remove_category_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
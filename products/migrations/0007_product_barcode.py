@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='barcode',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Código de barras / SKU'),
+        ),
+    ]
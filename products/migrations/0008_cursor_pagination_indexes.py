@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_barcode'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created', '-id'], name='product_created_id_idx'),
+        ),
+    ]
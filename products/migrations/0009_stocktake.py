@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_cursor_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stocktake',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Nombre')),
+                ('status', models.CharField(choices=[('OPEN', 'Abierta'), ('APPLIED', 'Aplicada')], default='OPEN', max_length=10, verbose_name='Estado')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('applied', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de aplicación')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Toma de inventario',
+                'verbose_name_plural': 'Tomas de inventario',
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StocktakeLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expected', models.IntegerField(default=0, verbose_name='Stock del sistema')),
+                ('counted', models.IntegerField(verbose_name='Cantidad contada')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product', verbose_name='Producto')),
+                ('stocktake', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='products.stocktake', verbose_name='Toma de inventario')),
+            ],
+            options={
+                'verbose_name': 'Línea de toma de inventario',
+                'verbose_name_plural': 'Líneas de toma de inventario',
+                'constraints': [models.UniqueConstraint(fields=('stocktake', 'product'), name='stocktake_line_product')],
+            },
+        ),
+    ]
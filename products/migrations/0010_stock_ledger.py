@@ -0,0 +1,77 @@
+# Generated by Django 5.1.15 on 2026-10-17 08:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 2000
+
+
+def opening_snapshot(apps, schema_editor):
+    """Saldo inicial del libro: una fotografía con el stock actual de cada producto"""
+    Product = apps.get_model('products', 'Product')
+    StockSnapshot = apps.get_model('products', 'StockSnapshot')
+    taken = timezone.now()
+    snapshots = (
+        StockSnapshot(product_id=product_id, taken=taken, stock=stock)
+        for product_id, stock in Product.objects.values_list('pk', 'stock').iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    for snapshot in snapshots:
+        batch.append(snapshot)
+        if len(batch) >= BATCH_SIZE:
+            StockSnapshot.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        StockSnapshot.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_stocktake'),
+        ('sales', '0011_dailysalesrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('SALE', 'Venta'), ('CANCEL', 'Anulación de venta'), ('EDIT', 'Edición de venta'), ('ADJUSTMENT', 'Ajuste'), ('RECEIPT', 'Recepción')], max_length=10, verbose_name='Tipo')),
+                ('quantity', models.IntegerField(verbose_name='Cantidad')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('note', models.CharField(blank=True, max_length=200, verbose_name='Nota')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='products.product', verbose_name='Producto')),
+                ('sale', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='sales.sale', verbose_name='Venta')),
+                ('stocktake', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.stocktake', verbose_name='Toma de inventario')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de stock',
+                'verbose_name_plural': 'Movimientos de stock',
+                'ordering': ['-created', '-id'],
+                'indexes': [models.Index(fields=['product', 'created'], name='stockmovement_product_idx'), models.Index(fields=['created'], name='stockmovement_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken', models.DateTimeField(verbose_name='Fecha')),
+                ('stock', models.IntegerField(verbose_name='Stock')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='products.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Fotografía de stock',
+                'verbose_name_plural': 'Fotografías de stock',
+                'ordering': ['-taken'],
+                'indexes': [models.Index(fields=['taken'], name='stocksnapshot_taken_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'taken'), name='stock_snapshot_product_taken')],
+            },
+        ),
+        migrations.RunPython(opening_snapshot, migrations.RunPython.noop),
+    ]
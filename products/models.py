@@ -1,5 +1,48 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Cast
 from django.urls import reverse
+from django.utils import timezone
+
+TAX_RATE_PERCENT = 19
+
+
+def net_amount(amount, with_tax):
+    """Retorna el monto neto (sin IVA) redondeado usando sólo aritmética entera"""
+    if not with_tax:
+        return amount
+    gross = 100 + TAX_RATE_PERCENT
+    return (amount * 100 + gross // 2) // gross
+
+
+def net_amount_expression(amount, with_tax):
+    """Equivalente SQL de net_amount() para calcular en la base de datos.
+
+    ``amount`` puede ser un nombre de campo o una expresión y ``with_tax``
+    el campo booleano que indica si incluye IVA. La división es entera,
+    igual que en Python, porque los montos son siempre positivos. El
+    cálculo se hace en bigint: ``amount * 100`` desborda un integer de
+    PostgreSQL con montos sobre 21 millones.
+    """
+    amount = Cast(amount, models.BigIntegerField())
+    gross = 100 + TAX_RATE_PERCENT
+    return Case(
+        When(**{with_tax: True}, then=(amount * 100 + gross // 2) / gross),
+        default=amount,
+        output_field=models.BigIntegerField(),
+    )
+
+def validate_net_prices(purchase_price, is_purchase_with_tax, sale_price, is_sale_with_tax):
+    """El precio de venta neto debe ser mayor al precio de compra neto"""
+    purchase_net = net_amount(purchase_price, is_purchase_with_tax)
+    sale_net = net_amount(sale_price, is_sale_with_tax)
+    if purchase_net and sale_net and sale_net <= purchase_net:
+        raise ValidationError(
+            "El precio de venta neto debe ser mayor al precio de compra neto."
+        )
 
 class Category(models.Model):
     name = models.CharField(max_length=200, verbose_name="Nombre")
@@ -14,9 +57,36 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def with_margin(self):
+        """Anota precios netos, margen unitario y porcentaje de ganancia en SQL.
+
+        Usa la misma aritmética entera que net_amount(): ``net_purchase_price``,
+        ``net_sale_price``, ``unit_margin`` y ``margin_percentage`` (truncado).
+        """
+        return self.annotate(
+            net_purchase_price=net_amount_expression('purchase_price', 'is_purchase_with_tax'),
+            net_sale_price=net_amount_expression('sale_price', 'is_sale_with_tax'),
+        ).annotate(
+            unit_margin=F('net_sale_price') - F('net_purchase_price'),
+            margin_percentage=Case(
+                When(net_purchase_price__gt=0, then=F('unit_margin') * 100 / F('net_purchase_price')),
+                default=Value(0),
+                output_field=models.IntegerField(),
+            ),
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200, verbose_name="Nombre")
     brand = models.CharField(max_length=100, verbose_name="Marca")
+    barcode = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name="Código de barras / SKU"
+    )
     category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name="Categoría")
     description = models.TextField(verbose_name="Descripción", blank=True)
     purchase_price = models.IntegerField(verbose_name="Precio de compra")
@@ -28,33 +98,237 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True, verbose_name="Activo")
     created = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de creación")
     updated = models.DateTimeField(auto_now=True, verbose_name="Fecha de actualización")
+    # Aumenta con cada edición del producto (no con los movimientos de stock)
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Versión")
+
+    objects = ProductQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        # Stock leído, para registrar en el libro de movimientos lo que cambie al guardar
+        product._loaded_stock = product.__dict__.get('stock')
+        return product
 
     def get_purchase_price_without_tax(self):
         """Retorna el precio de compra sin IVA"""
-        if self.is_purchase_with_tax:
-            return int(self.purchase_price / 1.19)
-        return self.purchase_price
+        if hasattr(self, 'net_purchase_price'):
+            return self.net_purchase_price
+        return net_amount(self.purchase_price, self.is_purchase_with_tax)
 
     def get_sale_price_without_tax(self):
         """Retorna el precio de venta sin IVA"""
-        if self.is_sale_with_tax:
-            return int(self.sale_price / 1.19)
-        return self.sale_price
+        if hasattr(self, 'net_sale_price'):
+            return self.net_sale_price
+        return net_amount(self.sale_price, self.is_sale_with_tax)
 
     def calculate_profit_percentage(self):
-        """Calcula el porcentaje de ganancia basado en precios netos"""
+        """Porcentaje de ganancia sobre precios netos (igual que with_margin())"""
+        if hasattr(self, 'margin_percentage'):
+            return self.margin_percentage
         purchase_net = self.get_purchase_price_without_tax()
-        sale_net = self.get_sale_price_without_tax()
-        
-        if purchase_net > 0:
-            profit = ((sale_net - purchase_net) / purchase_net) * 100
-            return int(profit)
-        return 0
+        if purchase_net <= 0:
+            return 0
+        # División entera truncada hacia cero, como en SQL
+        margin = (self.get_sale_price_without_tax() - purchase_net) * 100
+        percentage = abs(margin) // purchase_net
+        return percentage if margin >= 0 else -percentage
 
     class Meta:
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
         ordering = ['-created']
+        indexes = [
+            # Paginación por cursor del listado de productos
+            models.Index(fields=['-created', '-id'], name='product_created_id_idx'),
+            # Catálogo por cursor del selector de productos de las ventas
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class StocktakeLineQuerySet(models.QuerySet):
+    def with_variance(self):
+        """Anota la diferencia contada (``variance``) y su valor a costo neto (``variance_cost``)"""
+        return self.annotate(
+            variance=F('counted') - F('expected'),
+            net_unit_cost=net_amount_expression('product__purchase_price', 'product__is_purchase_with_tax'),
+        ).annotate(
+            variance_cost=F('variance') * F('net_unit_cost'),
+        )
+
+
+class Stocktake(models.Model):
+    """Toma de inventario físico: cantidades contadas que ajustan el stock"""
+    STATUS = [
+        ('OPEN', 'Abierta'),
+        ('APPLIED', 'Aplicada'),
+    ]
+
+    name = models.CharField(max_length=200, verbose_name="Nombre")
+    status = models.CharField(max_length=10, choices=STATUS, default='OPEN', verbose_name="Estado")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, null=True, blank=True, verbose_name="Usuario")
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de creación")
+    applied = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de aplicación")
+
+    class Meta:
+        verbose_name = "Toma de inventario"
+        verbose_name_plural = "Tomas de inventario"
+        ordering = ['-created']
+
+    def __str__(self):
+        return self.name
+
+
+class StocktakeLine(models.Model):
+    """Cantidad contada de un producto junto al stock del sistema al momento de cargarla"""
+    stocktake = models.ForeignKey(Stocktake, on_delete=models.CASCADE, related_name='lines', verbose_name="Toma de inventario")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Producto")
+    expected = models.IntegerField(default=0, verbose_name="Stock del sistema")
+    counted = models.IntegerField(verbose_name="Cantidad contada")
+
+    objects = StocktakeLineQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Línea de toma de inventario"
+        verbose_name_plural = "Líneas de toma de inventario"
+        constraints = [
+            models.UniqueConstraint(fields=['stocktake', 'product'], name='stocktake_line_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.counted}"
+
+
+# Margen para que las transacciones en curso confirmen sus movimientos
+# antes de que una fotografía de stock los dé por incluidos
+SNAPSHOT_SETTLE_TIME = timedelta(minutes=5)
+
+# Productos por consulta al tomar fotografías de stock
+SNAPSHOT_BATCH_SIZE = 2000
+
+
+class StockMovementManager(models.Manager):
+    def build(self, deltas, kind, **fields):
+        """Movimientos sin guardar a partir de ``{product_id: diferencia}``; omite las diferencias nulas"""
+        created = timezone.now()
+        return [
+            StockMovement(product_id=product_id, kind=kind, quantity=quantity, created=created, **fields)
+            for product_id, quantity in deltas.items()
+            if quantity
+        ]
+
+    def record(self, deltas, kind, **fields):
+        """Registra los movimientos con un solo INSERT"""
+        return self.bulk_create(self.build(deltas, kind, **fields))
+
+    def between(self, product, start, end):
+        """Movimientos de un producto en [start, end), en orden cronológico"""
+        return self.filter(product=product, created__gte=start, created__lt=end).order_by('created', 'pk')
+
+
+class StockMovement(models.Model):
+    """Libro de movimientos de stock: sólo se agregan filas, nunca se modifican"""
+    KINDS = [
+        ('SALE', 'Venta'),
+        ('CANCEL', 'Anulación de venta'),
+        ('EDIT', 'Edición de venta'),
+        ('ADJUSTMENT', 'Ajuste'),
+        ('RECEIPT', 'Recepción'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='movements', db_index=False, verbose_name="Producto")
+    kind = models.CharField(max_length=10, choices=KINDS, verbose_name="Tipo")
+    quantity = models.IntegerField(verbose_name="Cantidad")
+    created = models.DateTimeField(default=timezone.now, verbose_name="Fecha")
+    sale = models.ForeignKey('sales.Sale', on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements', verbose_name="Venta")
+    stocktake = models.ForeignKey(Stocktake, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Toma de inventario")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Usuario")
+    note = models.CharField(max_length=200, blank=True, verbose_name="Nota")
+
+    objects = StockMovementManager()
+
+    class Meta:
+        verbose_name = "Movimiento de stock"
+        verbose_name_plural = "Movimientos de stock"
+        ordering = ['-created', '-id']
+        indexes = [
+            # Movimientos de un producto en un rango y saldo desde la última fotografía
+            models.Index(fields=['product', 'created'], name='stockmovement_product_idx'),
+            models.Index(fields=['created'], name='stockmovement_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.quantity:+} ({self.product_id})"
+
+
+class StockSnapshotManager(models.Manager):
+    def latest_taken(self):
+        return self.order_by('-taken').values_list('taken', flat=True).first()
+
+    def stock_at(self, product, when):
+        """Stock de un producto en un instante: la última fotografía anterior más los movimientos posteriores"""
+        snapshot = self.filter(product=product, taken__lte=when).order_by('-taken').first()
+        movements = StockMovement.objects.filter(product=product, created__lte=when)
+        if snapshot:
+            movements = movements.filter(created__gt=snapshot.taken)
+        stock = snapshot.stock if snapshot else 0
+        return stock + movements.aggregate(total=Sum('quantity', default=0))['total']
+
+    def take(self, taken=None, batch_size=SNAPSHOT_BATCH_SIZE):
+        """Fotografía el stock de todos los productos a partir del libro de movimientos.
+
+        Cada fotografía es la anterior más los movimientos registrados
+        hasta ``taken``, por lo que coincide con el libro aunque haya
+        ventas en curso. Por defecto se toma unos minutos en el pasado
+        (SNAPSHOT_SETTLE_TIME) para no dejar fuera movimientos de
+        transacciones aún sin confirmar. Retorna la cantidad de filas
+        escritas, o 0 si ya existe una fotografía posterior.
+        """
+        taken = taken or timezone.now() - SNAPSHOT_SETTLE_TIME
+        previous = self.latest_taken()
+        if previous and taken <= previous:
+            return 0
+
+        written = 0
+        last_id = 0
+        while True:
+            batch = list(Product.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return written
+            last_id = batch[-1]
+            stock = {}
+            movements = StockMovement.objects.filter(product_id__in=batch, created__lte=taken)
+            if previous:
+                stock = dict(self.filter(taken=previous, product_id__in=batch).values_list('product_id', 'stock'))
+                movements = movements.filter(created__gt=previous)
+            for product_id, total in movements.values_list('product_id').annotate(total=Sum('quantity')).order_by():
+                stock[product_id] = stock.get(product_id, 0) + total
+            written += len(self.bulk_create([
+                StockSnapshot(product_id=product_id, taken=taken, stock=stock.get(product_id, 0))
+                for product_id in batch
+            ]))
+
+
+class StockSnapshot(models.Model):
+    """Stock de un producto en un instante, calculado desde el libro de movimientos"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='snapshots', db_index=False, verbose_name="Producto")
+    taken = models.DateTimeField(verbose_name="Fecha")
+    stock = models.IntegerField(verbose_name="Stock")
+
+    objects = StockSnapshotManager()
+
+    class Meta:
+        verbose_name = "Fotografía de stock"
+        verbose_name_plural = "Fotografías de stock"
+        ordering = ['-taken']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'taken'], name='stock_snapshot_product_taken'),
+        ]
+        indexes = [
+            models.Index(fields=['taken'], name='stocksnapshot_taken_idx'),
+        ]
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"{self.product_id}: {self.stock} ({self.taken:%d-%m-%Y %H:%M})"
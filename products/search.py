@@ -0,0 +1,42 @@
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+# Máximo de resultados que devuelve el buscador del punto de venta
+SEARCH_RESULT_LIMIT = 20
+
+# Columnas que necesita el JSON del buscador
+SEARCH_FIELDS = ('id', 'name', 'brand', 'stock', 'sale_price')
+
+
+def search_filter(term):
+    """Cada palabra del término debe aparecer en el nombre o en la marca"""
+    condition = Q()
+    for word in term.split():
+        condition &= Q(name__icontains=word) | Q(brand__icontains=word)
+    return condition
+
+
+def search_products(queryset, term):
+    """Filtra y ordena productos por relevancia para el término buscado.
+
+    En PostgreSQL los ``icontains`` se resuelven con los índices trigram
+    (GIN) sobre UPPER(name) y UPPER(brand), y los resultados se ordenan
+    por coincidencia de prefijo y luego por similitud. En otros motores
+    (SQLite en pruebas) se usa el mismo filtro ordenado por prefijo.
+    """
+    term = term.strip()
+    queryset = queryset.filter(search_filter(term)).annotate(
+        prefix_rank=Case(
+            When(name__istartswith=term, then=Value(0)),
+            When(brand__istartswith=term, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        )
+    )
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        return queryset.annotate(
+            similarity=TrigramSimilarity('name', term)
+        ).order_by('prefix_rank', '-similarity', 'name')
+    return queryset.order_by('prefix_rank', 'name')
@@ -0,0 +1,197 @@
+import heapq
+import threading
+import time
+import unicodedata
+from django.conf import settings
+from django.core.cache import caches
+from .search import SEARCH_FIELDS, SEARCH_RESULT_LIMIT
+
+VERSION_KEY = 'products:search_index:version'
+
+# Máximo de respuestas memorizadas por versión del índice
+MEMO_SIZE = 512
+
+
+def normalize(text):
+    """Pasa a minúsculas y quita tildes para comparar sin distinguirlas"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def bigrams(word):
+    return {word[index:index + 2] for index in range(len(word) - 1)}
+
+
+def is_enabled():
+    return getattr(settings, 'PRODUCT_SEARCH_INDEX', False)
+
+
+def shared_cache():
+    return caches[getattr(settings, 'PRODUCT_SEARCH_CACHE_ALIAS', 'default')]
+
+
+def seed_version(cache):
+    """Crea la versión compartida si no existe.
+
+    Parte de la hora actual y no de una constante: si la clave expiró,
+    una versión fija podría coincidir con la de una instantánea antigua
+    que algún worker todavía conserva.
+    """
+    cache.add(VERSION_KEY, time.time_ns(), None)
+
+
+def mark_stale():
+    """Invalida el índice de todos los workers subiendo la versión compartida"""
+    cache = shared_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # La clave no existe todavía (o expiró)
+        seed_version(cache)
+        cache.incr(VERSION_KEY)
+
+
+def with_live_stock(rows):
+    """Completa los resultados con el stock actual, en una sola consulta.
+
+    La instantánea no guarda el stock porque cambia con cada venta y el
+    índice sólo se invalida cuando un producto se agota o se repone; los
+    que se agotaron desde entonces se omiten.
+    """
+    from .models import Product
+
+    if not rows:
+        return []
+    stock = dict(
+        Product.objects.filter(pk__in=[row['id'] for row in rows], stock__gt=0).values_list('id', 'stock')
+    )
+    return [
+        {'id': row['id'], 'name': row['name'], 'brand': row['brand'], 'stock': stock[row['id']],
+         'sale_price': row['sale_price']}
+        for row in rows if row['id'] in stock
+    ]
+
+
+class IndexSnapshot:
+    """Tablas del índice para una versión; no se modifican una vez construidas"""
+
+    def __init__(self, version):
+        from .models import Product
+
+        self.version = version
+        self.products = {}
+        self.texts = {}
+        self.grams = {}
+        self.memo = {}
+        fields = [field for field in SEARCH_FIELDS if field != 'stock']
+        rows = Product.objects.filter(is_active=True, stock__gt=0).values(*fields)
+        for row in rows.iterator(chunk_size=2000):
+            product_id = row['id']
+            name = normalize(row['name'])
+            brand = normalize(row['brand'])
+            self.products[product_id] = {
+                'id': product_id,
+                'name': row['name'],
+                'brand': row['brand'] or '',
+                'sale_price': row['sale_price'] or 0
+            }
+            self.texts[product_id] = (name, brand)
+            for gram in bigrams(name) | bigrams(brand):
+                self.grams.setdefault(gram, set()).add(product_id)
+
+    def find(self, term, limit):
+        """Busca un término ya normalizado"""
+        words = term.split()
+        if not words:
+            return []
+
+        candidates = None
+        for word in words:
+            for gram in bigrams(word) or {word}:
+                ids = self.grams.get(gram, set()) if len(gram) == 2 else set(self.products)
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+
+        matches = []
+        for product_id in candidates:
+            name, brand = self.texts[product_id]
+            # La tabla de bigramas sólo preselecciona; se confirma la subcadena
+            if all(word in name or word in brand for word in words):
+                if name.startswith(term):
+                    rank = 0
+                elif brand.startswith(term):
+                    rank = 1
+                else:
+                    rank = 2
+                matches.append((rank, name, product_id))
+
+        return [self.products[product_id] for _, _, product_id in heapq.nsmallest(limit, matches)]
+
+
+class ProductSearchIndex:
+    """Índice en memoria de productos activos con stock para el autocompletado.
+
+    Se construye de forma perezosa en cada worker con una sola consulta y
+    guarda una tabla de bigramas sobre nombre y marca normalizados. Antes
+    de responder compara su versión con la del caché compartido; las
+    señales de Product y los cambios de stock que dejan un producto sin
+    stock (o se lo devuelven) suben esa versión. El stock de los
+    resultados se lee en cada búsqueda.
+
+    Las búsquedas leen una instantánea inmutable sin tomar el lock. La
+    reconstrucción ocurre fuera del lock y sólo el reemplazo de la
+    instantánea lo toma; mientras un hilo reconstruye, los demás siguen
+    respondiendo con la versión anterior. Las búsquedas idénticas dentro
+    de una misma versión se memorizan.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.building = False
+
+    def current_version(self):
+        cache = shared_cache()
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            seed_version(cache)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def build(self, version):
+        """Construye la instantánea de ``version`` y la publica"""
+        snapshot = IndexSnapshot(version)
+        with self.lock:
+            self.snapshot = snapshot
+        return snapshot
+
+    def current(self):
+        """Instantánea vigente, reconstruyéndola si la versión compartida cambió"""
+        version = self.current_version()
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self.lock:
+            if self.building and self.snapshot is not None:
+                return self.snapshot
+            self.building = True
+        try:
+            return self.build(version)
+        finally:
+            with self.lock:
+                self.building = False
+
+    def search(self, term, limit=SEARCH_RESULT_LIMIT):
+        snapshot = self.current()
+        key = (normalize(term).strip(), limit)
+        result = snapshot.memo.get(key)
+        if result is None:
+            result = snapshot.find(*key)
+            if len(snapshot.memo) >= MEMO_SIZE:
+                snapshot.memo.clear()
+            snapshot.memo[key] = result
+        return with_live_stock(result)
+
+
+product_search_index = ProductSearchIndex()
@@ -0,0 +1,56 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from .invalidation import products_changed
+from .models import Product, StockMovement
+
+CONFLICT_MESSAGE = "El producto fue modificado por otro usuario mientras lo editaba. Recargue la página e intente nuevamente."
+
+
+def update_product(product, fields, version, stock_delta=0, user=None):
+    """Guarda la edición de un producto sin pisar cambios ajenos ni bloquearlo.
+
+    Escribe sólo los campos indicados con un único
+    ``UPDATE ... WHERE version = n`` y aumenta la versión; si otra
+    edición ganó la carrera no se actualiza ninguna fila y se lanza
+    ValidationError. Con ``version=None`` (edición en el listado del
+    admin) no se compara la versión. El stock no se sobrescribe: se ajusta en
+    ``stock_delta`` (``stock = stock + delta``), de modo que las ventas
+    registradas mientras el formulario estaba abierto se conservan, y
+    el ajuste queda en el libro de movimientos.
+    """
+    fields = [name for name in fields if name not in ('stock', 'version', 'updated')]
+    if not fields and not stock_delta:
+        return product
+
+    values = {
+        # pre_save guarda los archivos subidos y calcula los campos automáticos
+        name: Product._meta.get_field(name).pre_save(product, add=False)
+        for name in fields + ['updated']
+    }
+    rows = Product.objects.filter(pk=product.pk)
+    if version is not None:
+        rows = rows.filter(version=version)
+    if stock_delta:
+        values['stock'] = F('stock') + stock_delta
+        if stock_delta < 0:
+            rows = rows.filter(stock__gte=-stock_delta)
+
+    with transaction.atomic():
+        if not rows.update(version=F('version') + 1, **values):
+            current = Product.objects.filter(pk=product.pk).values('version', 'stock').first()
+            if current is None or version is not None and current['version'] != version:
+                raise ValidationError(CONFLICT_MESSAGE)
+            raise ValidationError(
+                f"El stock actual ({current['stock']}) no permite descontar {-stock_delta} unidades"
+            )
+        if stock_delta:
+            StockMovement.objects.record(
+                {product.pk: stock_delta}, 'ADJUSTMENT', user=user, note="Edición del producto"
+            )
+        # El UPDATE no emite señales
+        products_changed()
+
+    product.refresh_from_db(fields=['stock', 'version'])
+    product._loaded_stock = product.stock
+    return product
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .invalidation import products_changed
+from .models import Product, StockMovement
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_caches(sender, **kwargs):
+    """El buscador, el stock bajo y los nombres de los bloques de ventas pueden haber cambiado"""
+    products_changed()
+
+
+@receiver(post_save, sender=Product)
+def record_stock_movement(sender, instance, created, update_fields=None, **kwargs):
+    """Registra en el libro de movimientos el stock inicial o el cambio hecho al editar el producto"""
+    if update_fields is not None and 'stock' not in update_fields:
+        return
+    loaded = 0 if created else getattr(instance, '_loaded_stock', None)
+    if loaded is not None and instance.stock != loaded:
+        StockMovement.objects.record(
+            {instance.pk: instance.stock - loaded},
+            'RECEIPT' if created else 'ADJUSTMENT',
+            note="Stock inicial" if created else "Edición del producto",
+        )
+    instance._loaded_stock = instance.stock
@@ -0,0 +1,179 @@
+import csv
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from core.streaming import Echo
+from dashboard import cache as dashboard_cache
+from .invalidation import products_changed
+from .models import Product, StockMovement, Stocktake, StocktakeLine
+
+# Productos resueltos y líneas escritas por consulta al cargar un conteo
+STOCKTAKE_CHUNK_SIZE = 2000
+
+REPORT_COLUMNS = [
+    ('product_id', 'producto_id'),
+    ('product__barcode', 'codigo'),
+    ('product__name', 'producto'),
+    ('expected', 'stock_sistema'),
+    ('counted', 'contado'),
+    ('variance', 'diferencia'),
+    ('variance_cost', 'valor_diferencia'),
+]
+
+
+def chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def read_counts(lines, delimiter=','):
+    """Lee el CSV de conteo: columna ``counted`` y ``barcode`` o ``product_id``.
+
+    Un mismo producto puede aparecer varias veces (por ejemplo, contado
+    en bodega y en sala); las cantidades se suman. Retorna
+    ``(por_código, por_id, errores)``.
+    """
+    reader = csv.DictReader(lines, delimiter=delimiter)
+    columns = {(column or '').strip() for column in reader.fieldnames or []}
+    if 'counted' not in columns or not columns & {'barcode', 'product_id'}:
+        raise ValidationError("El archivo debe tener la columna counted y barcode o product_id")
+
+    by_barcode, by_id, errors = {}, {}, []
+    for row in reader:
+        row = {(key or '').strip(): (value or '').strip() for key, value in row.items()}
+        line = reader.line_num
+        barcode, product_id = row.get('barcode', ''), row.get('product_id', '')
+        try:
+            counted = int(row.get('counted', ''))
+        except ValueError:
+            errors.append({'line': line, 'code': barcode or product_id, 'reason': f"Cantidad inválida: {row.get('counted')}"})
+            continue
+        if counted < 0:
+            errors.append({'line': line, 'code': barcode or product_id, 'reason': "La cantidad no puede ser negativa"})
+        elif barcode:
+            by_barcode.setdefault(barcode, [0, line])[0] += counted
+        elif product_id.isdigit():
+            by_id.setdefault(int(product_id), [0, line])[0] += counted
+        else:
+            errors.append({'line': line, 'code': product_id, 'reason': "Falta el código de barras o el ID del producto"})
+    return by_barcode, by_id, errors
+
+
+def load_counts(stocktake, lines, delimiter=',', chunk_size=STOCKTAKE_CHUNK_SIZE):
+    """Carga (o reemplaza) las cantidades contadas de una toma abierta.
+
+    Los productos se resuelven por bloques con una consulta que también
+    lee su stock actual, que queda como ``expected`` de la línea. Las
+    líneas se escriben con un upsert por bloque. Retorna
+    ``(líneas_cargadas, errores)``.
+    """
+    if stocktake.status != 'OPEN':
+        raise ValidationError("La toma de inventario ya fue aplicada")
+    by_barcode, by_id, errors = read_counts(lines, delimiter)
+
+    counts = {}
+    for batch in chunks(by_barcode, chunk_size):
+        found = dict(Product.objects.filter(barcode__in=batch).values_list('barcode', 'pk'))
+        for barcode in batch:
+            counted, line = by_barcode[barcode]
+            if barcode in found:
+                counts[found[barcode]] = counts.get(found[barcode], 0) + counted
+            else:
+                errors.append({'line': line, 'code': barcode, 'reason': "No existe un producto con ese código"})
+    for product_id, (counted, line) in by_id.items():
+        counts[product_id] = counts.get(product_id, 0) + counted
+
+    loaded = 0
+    with transaction.atomic():
+        for batch in chunks(counts, chunk_size):
+            stock = dict(Product.objects.filter(pk__in=batch).values_list('pk', 'stock'))
+            for product_id in batch:
+                if product_id not in stock:
+                    line = by_id.get(product_id, (0, 0))[1]
+                    errors.append({'line': line, 'code': str(product_id), 'reason': "No existe un producto con ese ID"})
+            StocktakeLine.objects.bulk_create(
+                [
+                    StocktakeLine(stocktake=stocktake, product_id=product_id, counted=counts[product_id], expected=stock[product_id])
+                    for product_id in batch if product_id in stock
+                ],
+                update_conflicts=True,
+                unique_fields=['stocktake', 'product'],
+                update_fields=['counted', 'expected'],
+            )
+            loaded += len(stock)
+    errors.sort(key=lambda error: error['line'])
+    return loaded, errors
+
+
+def variance_lines(stocktake, only_differences=True):
+    """Diferencias de la toma en una sola consulta, ordenadas por producto"""
+    lines = StocktakeLine.objects.filter(stocktake=stocktake).with_variance()
+    if only_differences:
+        lines = lines.exclude(variance=0)
+    return lines.order_by('product__name', 'product_id').values(*[field for field, _ in REPORT_COLUMNS])
+
+
+def variance_summary(stocktake):
+    """Totales de la toma: productos contados, con diferencia, unidades y valor"""
+    lines = StocktakeLine.objects.filter(stocktake=stocktake).with_variance()
+    return lines.aggregate(
+        products=Count('pk'),
+        differences=Count('pk', filter=~Q(variance=0)),
+        units_over=Sum('variance', filter=Q(variance__gt=0), default=0),
+        units_short=Sum('variance', filter=Q(variance__lt=0), default=0),
+        cost=Sum('variance_cost', default=0),
+    )
+
+
+def stream_report(stocktake, only_differences=True):
+    """Reporte de diferencias como CSV, fila por fila"""
+    writer = csv.writer(Echo())
+    yield writer.writerow([label for _, label in REPORT_COLUMNS])
+    for row in variance_lines(stocktake, only_differences).iterator(chunk_size=STOCKTAKE_CHUNK_SIZE):
+        yield writer.writerow([row[field] if row[field] is not None else '' for field, _ in REPORT_COLUMNS])
+
+
+def apply_stocktake(stocktake_id):
+    """Aplica todas las diferencias de la toma con un único UPDATE.
+
+    Cada producto se ajusta en ``contado - stock del sistema`` sobre su
+    stock actual (``stock = stock + diferencia``), de modo que las ventas
+    registradas entre el conteo y la aplicación no se pierden. Los
+    productos se bloquean antes del UPDATE para registrar en el libro de
+    movimientos el ajuste realmente aplicado (el stock nunca baja de
+    cero). Retorna la cantidad de productos ajustados.
+    """
+    with transaction.atomic():
+        stocktake = Stocktake.objects.select_for_update().get(pk=stocktake_id)
+        if stocktake.status != 'OPEN':
+            raise ValidationError("La toma de inventario ya fue aplicada")
+
+        lines = StocktakeLine.objects.filter(stocktake=stocktake).exclude(counted=F('expected'))
+        stock = dict(
+            Product.objects.select_for_update().filter(pk__in=lines.values('product_id')).order_by('pk').values_list('pk', 'stock')
+        )
+        deltas = {
+            product_id: max(stock[product_id] + variance, 0) - stock[product_id]
+            for product_id, variance in lines.values_list('product_id', F('counted') - F('expected'))
+        }
+        variance = Subquery(
+            lines.filter(product=OuterRef('pk')).annotate(
+                variance=F('counted') - F('expected')
+            ).values('variance')[:1]
+        )
+        adjusted = Product.objects.filter(pk__in=lines.values('product_id')).update(
+            stock=Greatest(F('stock') + variance, Value(0)),
+            updated=timezone.now(),
+        )
+        StockMovement.objects.record(deltas, 'ADJUSTMENT', stocktake=stocktake, user=stocktake.user)
+
+        stocktake.status = 'APPLIED'
+        stocktake.applied = timezone.now()
+        stocktake.save(update_fields=['status', 'applied'])
+        if adjusted:
+            crossed = any((stock[product_id] > 0) != (stock[product_id] + delta > 0) for product_id, delta in deltas.items())
+            products_changed(dashboard_cache.STOCK, search=crossed)
+    return adjusted
@@ -1,3 +1,370 @@
-from django.test import TestCase
+import csv
+import io
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from core.testing import LOCMEM_CACHES
+from sales.services import checkout, edit_sale, transition_sale
+from . import search_index
+from .catalog_import import import_catalog
+from .models import Category, Product, StockMovement, StockSnapshot, Stocktake
+from .stocktake import apply_stocktake, load_counts, stream_report, variance_summary
 
-# Create your tests here.
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StockLedgerTests(TestCase):
+    """La última fotografía más los movimientos posteriores debe dar siempre el stock actual"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('cajero', password='clave')
+        category = Category.objects.create(name='General')
+        cls.products = [
+            Product.objects.create(
+                name=f'Producto {index}', brand='Marca', category=category,
+                purchase_price=400, sale_price=1000, stock=20,
+            )
+            for index in range(2)
+        ]
+
+    def cart(self, *lines):
+        return [
+            {'product_id': self.products[index].pk, 'quantity': quantity, 'price': 1000}
+            for index, quantity in lines
+        ]
+
+    def assertLedgerMatchesStock(self):
+        now = timezone.now()
+        for product in Product.objects.all():
+            self.assertEqual(StockSnapshot.objects.stock_at(product, now), product.stock)
+
+    def test_every_stock_change_is_recorded(self):
+        sale = checkout(self.cart((0, 3), (1, 2)), self.user, 'CASH', 'COMPLETED')
+        edit_sale(sale, self.cart((0, 5)), 'CASH', 'COMPLETED')
+        transition_sale(sale.pk, 'CANCELLED')
+        self.assertLedgerMatchesStock()
+
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.stock = 25
+        product.save()
+
+        stocktake = Stocktake.objects.create(name='Conteo', user=self.user)
+        load_counts(stocktake, io.StringIO(f"product_id,counted\n{self.products[1].pk},1\n"))
+        # Venta entre el conteo y el ajuste: el stock no puede quedar negativo
+        checkout(self.cart((1, 20)), self.user, 'CASH', 'COMPLETED')
+        apply_stocktake(stocktake.pk)
+        self.assertEqual(Product.objects.get(pk=self.products[1].pk).stock, 0)
+        self.assertLedgerMatchesStock()
+
+        kinds = StockMovement.objects.filter(product=self.products[0]).order_by('created', 'pk')
+        self.assertEqual(
+            list(kinds.values_list('kind', 'quantity')),
+            [('RECEIPT', 20), ('SALE', -3), ('EDIT', -2), ('CANCEL', 5), ('ADJUSTMENT', 5)],
+        )
+
+    def test_stock_at_uses_snapshot_and_later_movements(self):
+        checkout(self.cart((0, 4)), self.user, 'CASH', 'COMPLETED')
+        taken = timezone.now()
+        self.assertEqual(StockSnapshot.objects.take(taken=taken), 2)
+        self.assertEqual(StockSnapshot.objects.take(taken=taken), 0)
+        checkout(self.cart((0, 6)), self.user, 'CASH', 'COMPLETED')
+
+        product = self.products[0]
+        self.assertEqual(StockSnapshot.objects.get(product=product, taken=taken).stock, 16)
+        self.assertEqual(StockSnapshot.objects.stock_at(product, taken), 16)
+        self.assertLedgerMatchesStock()
+
+        StockSnapshot.objects.take(taken=timezone.now())
+        self.assertEqual(StockSnapshot.objects.stock_at(product, taken), 16)
+        self.assertLedgerMatchesStock()
+        movements = StockMovement.objects.between(product, taken, timezone.now() + timedelta(seconds=1))
+        self.assertEqual(list(movements.values_list('quantity', flat=True)), [-6])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductEditTests(TestCase):
+    """Editar un producto no debe deshacer las ventas hechas mientras el formulario estaba abierto"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'clave', role='admin')
+        cls.category = Category.objects.create(name='General')
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Producto', brand='Marca', category=self.category,
+            purchase_price=400, sale_price=1000, stock=20,
+        )
+        self.client.force_login(self.user)
+
+    def form_data(self, **changes):
+        data = {
+            'name': 'Producto', 'brand': 'Marca', 'barcode': '', 'category': self.category.pk,
+            'description': '', 'purchase_price': 400, 'is_purchase_with_tax': 'on',
+            'sale_price': 1000, 'is_sale_with_tax': 'on', 'is_active': 'on',
+            'stock': 20, 'initial-stock': 20, 'loaded_version': 0,
+        }
+        data.update(changes)
+        return data
+
+    def sell(self, quantity):
+        checkout(
+            [{'product_id': self.product.pk, 'quantity': quantity, 'price': 1000}],
+            self.user, 'CASH', 'COMPLETED'
+        )
+
+    def test_edit_keeps_concurrent_sales(self):
+        self.sell(5)
+        url = reverse('products:update', args=[self.product.pk])
+        response = self.client.post(url, self.form_data(name='Producto nuevo'))
+        self.assertRedirects(response, reverse('products:list'), fetch_redirect_response=False)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.stock, self.product.version), ('Producto nuevo', 15, 1))
+
+        self.sell(3)
+        self.client.post(url, self.form_data(name='Producto nuevo', stock=30, loaded_version=1))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 22)
+        self.assertEqual(
+            list(StockMovement.objects.filter(product=self.product, kind='ADJUSTMENT').values_list('quantity', flat=True)),
+            [10],
+        )
+
+    def test_stale_version_is_rejected(self):
+        Product.objects.filter(pk=self.product.pk).update(version=1, brand='Otra marca')
+        response = self.client.post(
+            reverse('products:update', args=[self.product.pk]), self.form_data(name='Producto nuevo')
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].non_field_errors())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.brand), ('Producto', 'Otra marca'))
+
+    def test_admin_list_editable_adjusts_stock(self):
+        self.sell(5)
+        response = self.client.post(reverse('admin:products_product_changelist'), {
+            'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1,
+            'form-MIN_NUM_FORMS': 0, 'form-MAX_NUM_FORMS': 1000,
+            'form-0-id': self.product.pk,
+            'form-0-stock': 25, 'initial-form-0-stock': 20,
+            'form-0-is_active': 'on', 'initial-form-0-is_active': 'True',
+            '_save': 'Guardar',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 20)
+        self.assertEqual(StockSnapshot.objects.stock_at(self.product, timezone.now()), 20)
+
+    def test_admin_conflicts_are_form_errors(self):
+        self.sell(18)
+        response = self.client.post(reverse('admin:products_product_changelist'), {
+            'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1,
+            'form-MIN_NUM_FORMS': 0, 'form-MAX_NUM_FORMS': 1000,
+            'form-0-id': self.product.pk,
+            'form-0-stock': 0, 'initial-form-0-stock': 20,
+            'form-0-is_active': 'on', 'initial-form-0-is_active': 'True',
+            '_save': 'Guardar',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['cl'].formset.errors[0]['stock'])
+
+        Product.objects.filter(pk=self.product.pk).update(version=1)
+        response = self.client.post(
+            reverse('admin:products_product_change', args=[self.product.pk]),
+            self.form_data(name='Producto nuevo', stock=2, **{'initial-stock': 2}),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['adminform'].form.non_field_errors())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.stock, self.product.version), ('Producto', 2, 1))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PRODUCT_SEARCH_INDEX=True)
+class ProductSearchIndexTests(TestCase):
+    """El índice en memoria no responde con stock ni versiones desactualizados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='General')
+        cls.product = Product.objects.create(
+            name='Café molido', brand='Marca', category=category,
+            purchase_price=400, sale_price=1000, stock=10,
+        )
+
+    def setUp(self):
+        search_index.shared_cache().clear()
+        self.index = search_index.ProductSearchIndex()
+
+    def test_results_show_current_stock(self):
+        self.assertEqual([row['stock'] for row in self.index.search('cafe')], [10])
+        # Un UPDATE que no agota el producto no invalida el índice
+        Product.objects.filter(pk=self.product.pk).update(stock=F('stock') - 3)
+        self.assertEqual([row['stock'] for row in self.index.search('cafe')], [7])
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+        self.assertEqual(self.index.search('cafe'), [])
+
+    def test_evicted_version_is_not_reused(self):
+        search_index.mark_stale()
+        snapshot = self.index.current()
+        search_index.shared_cache().delete(search_index.VERSION_KEY)
+        search_index.mark_stale()
+        self.assertIsNot(self.index.current(), snapshot)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogImportTests(TestCase):
+    """El CSV del proveedor crea o actualiza productos por código de barras"""
+
+    HEADER = 'barcode,name,brand,category,purchase_price,sale_price'
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='General')
+        cls.product = Product.objects.create(
+            name='Producto', brand='Marca', category=category, barcode='780001',
+            description='Descripción', purchase_price=400, sale_price=1000, stock=20,
+            is_purchase_with_tax=False, is_active=False,
+        )
+
+    def run_import(self, *rows, header=HEADER):
+        return import_catalog(io.StringIO('\n'.join([header, *rows]) + '\n'))
+
+    def test_upsert_by_barcode(self):
+        result = self.run_import(
+            '780001,Producto nuevo,Marca,General,500,1200,99',
+            '780002,Otro,Marca,Bebidas,300,800,12',
+            header=f'{self.HEADER},stock',
+        )
+        self.assertEqual((result.created, result.updated, result.errors), (1, 1, []))
+        self.product.refresh_from_db()
+        # El stock del archivo sólo se usa al crear el producto
+        self.assertEqual((self.product.name, self.product.stock, self.product.version), ('Producto nuevo', 20, 1))
+        created = Product.objects.get(barcode='780002')
+        self.assertEqual((created.category.name, created.stock), ('Bebidas', 12))
+        self.assertEqual(
+            list(StockMovement.objects.filter(product=created).values_list('kind', 'quantity')),
+            [('RECEIPT', 12)],
+        )
+
+    def test_invalid_rows_are_reported(self):
+        result = self.run_import(
+            '780010,Sin precio,Marca,General,abc,1000',
+            '780011,Negativo,Marca,General,-1,1000',
+            '780012,,Marca,General,400,1000',
+            '780013,Bajo costo,Marca,General,1000,900',
+            '780014,Válido,Marca,General,400,1000',
+            '780014,Repetido,Marca,General,400,1000',
+        )
+        self.assertEqual(result.created, 1)
+        self.assertEqual(
+            [(error['line'], error['barcode']) for error in result.errors],
+            [(2, '780010'), (3, '780011'), (4, '780012'), (5, '780013'), (7, '780014')],
+        )
+        self.assertIn('línea 6', result.errors[-1]['reason'])
+        self.assertEqual(Product.objects.get(barcode='780014').name, 'Válido')
+
+        with self.assertRaises(ValidationError):
+            self.run_import('780015,Producto', header='barcode,name')
+
+    def test_missing_optional_columns_are_kept(self):
+        result = self.run_import('780001,Producto nuevo,Marca,General,500,1200')
+        self.assertEqual((result.created, result.updated, result.errors), (0, 1, []))
+        self.product.refresh_from_db()
+        self.assertEqual(
+            (self.product.name, self.product.purchase_price, self.product.description,
+             self.product.is_purchase_with_tax, self.product.is_active, self.product.stock),
+            ('Producto nuevo', 500, 'Descripción', False, False, 20),
+        )
+
+        self.run_import('780001,Producto nuevo,Marca,General,500,1200,,si', header=f'{self.HEADER},description,is_active')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.description, self.product.is_active), ('', True))
+
+    def test_net_prices_use_the_existing_tax_flags(self):
+        # El producto existente compra sin IVA: 1000 neto contra 924 de venta
+        result = self.run_import(
+            '780001,Producto,Marca,General,1000,1100',
+            '780020,Nuevo,Marca,General,1000,1100',
+        )
+        self.assertEqual((result.created, result.updated), (1, 0))
+        self.assertEqual([(error['line'], error['barcode']) for error in result.errors], [(2, '780001')])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.purchase_price, 400)
+
+        result = self.run_import('780001,Producto,Marca,General,1000,1100,si', header=f'{self.HEADER},is_purchase_with_tax')
+        self.assertEqual((result.updated, result.errors), (1, []))
+
+    def test_out_of_range_amount_is_a_row_error(self):
+        _, max_value = connection.ops.integer_field_range('IntegerField')
+        result = self.run_import(
+            f'780002,Caro,Marca,General,400,{max_value + 1}',
+            '780003,Barato,Marca,General,400,1000',
+        )
+        self.assertEqual(result.created, 1)
+        self.assertEqual([(error['line'], error['barcode']) for error in result.errors], [(2, '780002')])
+        self.assertIn('máximo', result.errors[0]['reason'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StocktakeTests(TestCase):
+    """La toma de inventario informa las diferencias y las aplica sobre el stock actual"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('bodega', password='clave')
+        category = Category.objects.create(name='General')
+        cls.products = [
+            Product.objects.create(
+                name=f'Producto {index}', brand='Marca', category=category, barcode=f'78000{index}',
+                purchase_price=119, is_purchase_with_tax=True, sale_price=1000, stock=10,
+            )
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        self.stocktake = Stocktake.objects.create(name='Conteo', user=self.user)
+
+    def load(self, *rows, header='barcode,counted'):
+        return load_counts(self.stocktake, io.StringIO('\n'.join([header, *rows]) + '\n'))
+
+    def test_variance_report(self):
+        loaded, errors = self.load('780000,7', '780000,5', '780001,6', '780002,10', '999999,1', '780002,-1')
+        self.assertEqual(loaded, 3)
+        self.assertEqual([(error['line'], error['code']) for error in errors], [(6, '999999'), (7, '780002')])
+
+        summary = variance_summary(self.stocktake)
+        self.assertEqual(
+            summary,
+            {'products': 3, 'differences': 2, 'units_over': 2, 'units_short': -4, 'cost': -200},
+        )
+        rows = list(csv.reader(''.join(stream_report(self.stocktake)).splitlines()))
+        self.assertEqual(rows[0][:2], ['producto_id', 'codigo'])
+        self.assertEqual(
+            [(row[1], row[5], row[6]) for row in rows[1:]],
+            [('780000', '2', '200'), ('780001', '-4', '-400')],
+        )
+
+    def test_apply_keeps_sales_made_after_counting(self):
+        self.load('780000,4', '780001,15', header='barcode,counted')
+        checkout(
+            [{'product_id': self.products[0].pk, 'quantity': 8, 'price': 1000}],
+            self.user, 'CASH', 'COMPLETED'
+        )
+        self.assertEqual(apply_stocktake(self.stocktake.pk), 2)
+        stock = dict(Product.objects.values_list('barcode', 'stock'))
+        # 10 - 8 vendidas y -6 de diferencia: el stock no baja de cero
+        self.assertEqual((stock['780000'], stock['780001'], stock['780002']), (0, 15, 10))
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(stocktake=self.stocktake).values_list('product__barcode', 'quantity')),
+            [('780000', -2), ('780001', 5)],
+        )
+        with self.assertRaises(ValidationError):
+            apply_stocktake(self.stocktake.pk)
+        self.stocktake.refresh_from_db()
+        with self.assertRaises(ValidationError):
+            self.load('780002,1')
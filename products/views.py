@@ -2,23 +2,34 @@ from django.views.generic import ListView, CreateView, UpdateView, DeleteView, D
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.contrib import messages
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.shortcuts import redirect
 from .models import Product, Category
 from users.mixins import AdminRequiredMixin
 from .forms import ProductForm 
+from .search import search_products
+from core.pagination import CursorPaginationMixin
 
-class ProductListView(LoginRequiredMixin, ListView):
+class ProductListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = Product
     template_name = 'products/list.html'
     context_object_name = 'products'
-    paginate_by = 10
+    cursor_ordering = ['-created', '-id']
+
+    def get_cursor_ordering(self):
+        # Con búsqueda, primero las coincidencias por prefijo
+        if self.request.GET.get('search'):
+            return ['prefix_rank', *self.cursor_ordering]
+        return self.cursor_ordering
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('category').with_margin()
         search = self.request.GET.get('search', '')
         category = self.request.GET.get('category', '')
         
         if search:
-            queryset = queryset.filter(name__icontains=search)
+            queryset = search_products(queryset, search)
         if category:
             queryset = queryset.filter(category_id=category)
             
@@ -34,6 +45,9 @@ class ProductDetailView(LoginRequiredMixin, DetailView):
     template_name = 'products/detail.html'
     context_object_name = 'product'
 
+    def get_queryset(self):
+        return super().get_queryset().with_margin()
+
 class ProductCreateView(LoginRequiredMixin, AdminRequiredMixin, CreateView):
     model = Product
     form_class = ProductForm
@@ -67,9 +81,20 @@ class ProductUpdateView(LoginRequiredMixin, AdminRequiredMixin, UpdateView):
             })
         return form
 
+    def post(self, request, *args, **kwargs):
+        # La fila que bloquea la validación del formulario sigue bloqueada al guardar
+        with transaction.atomic():
+            return super().post(request, *args, **kwargs)
+
     def form_valid(self, form):
+        # Sólo los campos modificados; el stock como ajuste relativo
+        try:
+            self.object = form.save_changes(self.request.user)
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
         messages.success(self.request, 'Producto actualizado exitosamente.')
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
 
 class ProductDeleteView(LoginRequiredMixin, AdminRequiredMixin, DeleteView):
     model = Product
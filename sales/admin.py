@@ -1,22 +1,111 @@
-from django.contrib import admin
-from .models import Sale, SaleDetail
+from datetime import timedelta
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from .models import DailySalesRollup, Sale, SaleDetail
+from .services import change_payment_method, settle_sales
 
 class SaleDetailInline(admin.TabularInline):
     model = SaleDetail
     extra = 0
-    readonly_fields = ['product', 'quantity', 'unit_price', 'subtotal', 'purchase_price', 'is_tax_included']
+    readonly_fields = [
+        'product', 'quantity', 'unit_price', 'subtotal', 'purchase_price', 'is_tax_included',
+        'is_purchase_with_tax', 'net_unit_cost', 'net_profit',
+    ]
     can_delete = False
 
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class SaleAdminForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Se compara con el medio de pago mostrado, no con el actual
+        self.fields['payment_method'].show_hidden_initial = True
+
+
 @admin.register(Sale)
 class SaleAdmin(admin.ModelAdmin):
-    list_display = ['number', 'date', 'user', 'total', 'status', 'payment_method', 'is_stock_deducted']
+    list_display = ['number', 'date', 'user', 'total', 'item_count', 'net_profit', 'status', 'payment_method', 'is_stock_deducted']
     list_filter = ['status', 'payment_method', 'date']
     search_fields = ['number', 'user__username']
-    readonly_fields = ['number', 'date', 'total', 'user', 'is_stock_deducted']
+    readonly_fields = ['number', 'date', 'total', 'user', 'status', 'is_stock_deducted', 'is_modified', 'item_count', 'units_total', 'net_profit', 'version']
+    form = SaleAdminForm
     inlines = [SaleDetailInline]  
+    actions = ['settle_selected']
+
+    def has_add_permission(self, request):
+        # Las ventas se registran en el punto de venta (checkout)
+        return False
+
+    def save_model(self, request, obj, form, change):
+        """Sólo escribe el medio de pago, con compare-and-swap.
+
+        Un save() completo reescribiría el estado, el stock descontado y
+        la versión leídos con el formulario, pisando transiciones
+        concurrentes.
+        """
+        if 'payment_method' in form.changed_data:
+            sale = change_payment_method(obj.pk, form.cleaned_data['payment_method'])
+            obj.version = sale.version
+
+    def save_related(self, request, form, formsets, change):
+        # Recalcula el total una sola vez en vez de hacerlo por cada línea
+        with Sale.objects.deferred_summary():
+            super().save_related(request, form, formsets, change)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Sale.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        # Las ventas completadas eliminadas dejan de contar en el resumen diario
+        days = {
+            timezone.localdate(date)
+            for date in queryset.filter(status='COMPLETED').values_list('date', flat=True)
+        }
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+            for day in days:
+                DailySalesRollup.objects.rebuild(day, day + timedelta(days=1))
+
+    @admin.action(description="Completar ventas pendientes seleccionadas")
+    def settle_selected(self, request, queryset):
+        try:
+            settled, failed = settle_sales(queryset.values_list('pk', flat=True))
+        except ValidationError as e:
+            self.message_user(request, ' '.join(e.messages), messages.ERROR)
+            return
+        if settled:
+            self.message_user(request, f"{len(settled)} venta(s) completada(s).", messages.SUCCESS)
+        for failure in failed:
+            self.message_user(request, f"Venta #{failure['number']}: {failure['reason']}", messages.WARNING)
 
 @admin.register(SaleDetail)
 class SaleDetailAdmin(admin.ModelAdmin):
-    list_display = ['sale', 'product', 'quantity', 'unit_price', 'subtotal']
+    list_display = ['sale', 'product', 'quantity', 'unit_price', 'subtotal', 'net_revenue', 'net_profit']
     search_fields = ['sale__number', 'product__name']
-    readonly_fields = ['sale', 'product', 'quantity', 'unit_price', 'subtotal', 'purchase_price', 'is_tax_included']
+    readonly_fields = ['sale', 'product', 'quantity', 'unit_price', 'subtotal', 'purchase_price', 'is_tax_included', 'is_purchase_with_tax', 'net_unit_cost', 'net_profit']
+    list_select_related = ['sale', 'product']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_net_profit()
+
+    @admin.display(description="Subtotal neto", ordering='net_revenue')
+    def net_revenue(self, obj):
+        return obj.net_revenue
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ['day', 'product', 'payment_method', 'user', 'units', 'gross', 'net_revenue', 'net_profit']
+    list_filter = ['day', 'payment_method']
+    search_fields = ['product__name', 'user__username']
+    list_select_related = ['product', 'user']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,43 +1,76 @@
+from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from django.db.models import Q
 from products.models import Product
+from products import search, search_index
+from core.pagination import keyset_page
+from .cart import Cart
 import json
 from django.views.decorators.http import require_http_methods
 
 def search_products(request):
     term = request.GET.get('term', '').strip()
-    print(f"Término de búsqueda: {term}")
 
     if len(term) < 2:
         return JsonResponse([], safe=False)
 
-   
-    products = Product.objects.filter(
-        Q(name__icontains=term) | Q(brand__icontains=term),
-        is_active=True,
-        stock__gt=0
-    ).order_by('name')  # Ordenados por nombre
+    if search_index.is_enabled():
+        return JsonResponse(search_index.product_search_index.search(term), safe=False)
 
-    # Debug - Imprimir todos los productos activos
-    print("\nTodos los productos activos:")
-    all_products = Product.objects.filter(is_active=True)
-    for p in all_products:
-        print(f"- {p.name} (Marca: {p.brand}, Activo: {p.is_active}, Stock: {p.stock})")
+    products = search.search_products(
+        Product.objects.filter(is_active=True, stock__gt=0), term
+    ).values(*search.SEARCH_FIELDS)[:search.SEARCH_RESULT_LIMIT]
 
     # Convertimos a lista y preparar para JSON
     product_list = []
     for product in products:
         product_list.append({
-            'id': product.id,
-            'name': product.name,
-            'brand': product.brand if product.brand else '',
-            'stock': product.stock,
-            'sale_price': int(product.sale_price) if product.sale_price else 0
+            'id': product['id'],
+            'name': product['name'],
+            'brand': product['brand'] or '',
+            'stock': product['stock'],
+            'sale_price': product['sale_price'] or 0
         })
 
-    print(f"Productos encontrados: {product_list}")
     return JsonResponse(product_list, safe=False)
 
+@login_required
+def list_products(request):
+    """Catálogo paginado por cursor para el selector de productos.
+
+    Parámetros: ``term`` (opcional), ``in_stock=1`` para omitir productos
+    sin stock, ``cursor``/``before`` devueltos por la página anterior y
+    ``limit``. Ordena por (nombre, id) sin OFFSET ni COUNT(*).
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', search.SEARCH_RESULT_LIMIT)), 1), 100)
+    except ValueError:
+        limit = search.SEARCH_RESULT_LIMIT
+
+    products = Product.objects.filter(is_active=True)
+    if request.GET.get('in_stock') == '1':
+        products = products.filter(stock__gt=0)
+    term = request.GET.get('term', '').strip()
+    if term:
+        products = products.filter(search.search_filter(term))
+
+    before = request.GET.get('before')
+    rows, next_cursor, previous_cursor = keyset_page(
+        products.values(*search.SEARCH_FIELDS),
+        ['name', 'id'],
+        cursor=before or request.GET.get('cursor'),
+        limit=limit,
+        reverse=bool(before),
+    )
+
+    return JsonResponse({
+        'results': [
+            {**row, 'brand': row['brand'] or '', 'sale_price': row['sale_price'] or 0}
+            for row in rows
+        ],
+        'next': next_cursor,
+        'previous': previous_cursor,
+    })
+
 def add_to_cart(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
@@ -55,36 +88,21 @@ def add_to_cart(request):
             }, status=400)
 
         # Obtener o inicializar el carrito
-        cart = request.session.get('cart', [])
+        cart = Cart(request)
         
-        # Buscar si el producto ya está en el carrito
-        found = False
-        for item in cart:
-            if item['product_id'] == product_id:
-                new_quantity = item['quantity'] + quantity
-                if new_quantity > product.stock:
-                    return JsonResponse({
-                        'error': f'Stock insuficiente. Stock disponible: {product.stock}'
-                    }, status=400)
-                item['quantity'] = new_quantity
-                found = True
-                break
-
-        if not found:
-            cart.append({
-                'product_id': product_id,
-                'name': product.name,
-                'quantity': quantity,
-                'price': product.sale_price
-            })
+        # Sumar a la cantidad si el producto ya está en el carrito
+        item = cart.get(product.pk)
+        if item:
+            quantity += item['quantity']
+            if quantity > product.stock:
+                return JsonResponse({
+                    'error': f'Stock insuficiente. Stock disponible: {product.stock}'
+                }, status=400)
 
-        request.session['cart'] = cart
+        cart.set(product.pk, product.name, product.sale_price, quantity)
+        cart.save()
         
-        return JsonResponse({
-            'success': True,
-            'cart': cart,
-            'total': sum(item['price'] * item['quantity'] for item in cart)
-        })
+        return JsonResponse({'success': True, **cart.as_json()})
 
     except Product.DoesNotExist:
         return JsonResponse({'error': 'Producto no encontrado'}, status=404)
@@ -111,20 +129,13 @@ def update_cart(request):
             }, status=400)
 
         # Actualizar cantidad en el carrito
-        cart = request.session.get('cart', [])
-        
-        for item in cart:
-            if item['product_id'] == product_id:
-                item['quantity'] = quantity
-                break
-
-        request.session['cart'] = cart
+        cart = Cart(request)
+        item = cart.get(product.pk)
+        if item:
+            cart.set(product.pk, item['name'], item['price'], quantity)
+            cart.save()
         
-        return JsonResponse({
-            'success': True,
-            'cart': cart,
-            'total': sum(item['price'] * item['quantity'] for item in cart)
-        })
+        return JsonResponse({'success': True, **cart.as_json()})
 
     except Product.DoesNotExist:
         return JsonResponse({'error': 'Producto no encontrado'}, status=404)
@@ -137,22 +148,148 @@ def remove_from_cart(request, product_id):
     if request.method != 'POST':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
 
-    cart = request.session.get('cart', [])
-    cart = [item for item in cart if item['product_id'] != product_id]
-    request.session['cart'] = cart
+    cart = Cart(request)
+    cart.remove(product_id)
+    cart.save()
     
-    return JsonResponse({
-        'success': True,
-        'cart': cart,
-        'total': sum(item['price'] * item['quantity'] for item in cart)
-    })
+    return JsonResponse({'success': True, **cart.as_json()})
+
+@login_required
+@require_http_methods(["POST"])
+def scan_product(request):
+    """Busca un producto por código de barras/SKU y lo agrega al carrito.
+
+    Recibe ``{"code": "7801234567890", "quantity": 1}``; la búsqueda es una
+    sola consulta por el índice único de ``barcode``.
+    """
+    try:
+        data = json.loads(request.body)
+        code = str(data.get('code', '')).strip()
+        quantity = int(data.get('quantity', 1))
+        if not code:
+            return JsonResponse({'error': 'Código no informado'}, status=400)
+        if quantity < 1:
+            return JsonResponse({'error': 'La cantidad debe ser mayor a 0'}, status=400)
+
+        product = Product.objects.only('id', 'name', 'brand', 'stock', 'sale_price').get(
+            barcode=code, is_active=True
+        )
+
+        cart = Cart(request)
+        item = cart.get(product.pk)
+        if item:
+            quantity += item['quantity']
+        if quantity > product.stock:
+            return JsonResponse({
+                'error': f'Stock insuficiente. Stock disponible: {product.stock}'
+            }, status=400)
+
+        cart.set(product.pk, product.name, product.sale_price, quantity)
+        cart.save()
+
+        return JsonResponse({
+            'success': True,
+            'product': {
+                'id': product.pk,
+                'name': product.name,
+                'brand': product.brand or '',
+                'stock': product.stock,
+                'sale_price': product.sale_price
+            },
+            **cart.as_json()
+        })
+
+    except Product.DoesNotExist:
+        return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+    except (json.JSONDecodeError, ValueError):
+        return JsonResponse({'error': 'Datos inválidos'}, status=400)
+
+@login_required
+@require_http_methods(["POST"])
+def cart_batch(request):
+    """Aplica en una sola solicitud varias operaciones sobre el carrito.
+
+    Recibe ``{"operations": [{"op": "add"|"update"|"remove", "product_id": 1,
+    "quantity": 2}, ...]}``. Los productos se validan con una sola consulta
+    y las operaciones se aplican todas o ninguna; el carrito se escribe una
+    vez y la respuesta trae sólo las líneas modificadas.
+    """
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Datos inválidos'}, status=400)
+        operations = data.get('operations', [])
+        if not operations:
+            return JsonResponse({'error': 'No se indicaron operaciones'}, status=400)
+        if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+            return JsonResponse({'error': 'Datos inválidos'}, status=400)
+
+        product_ids = {int(operation['product_id']) for operation in operations}
+        products = Product.objects.only('id', 'name', 'stock', 'sale_price').in_bulk(product_ids)
+
+        cart = Cart(request)
+        changed = {}  # Conserva el orden en que se tocaron las líneas
+        errors = []
+        for index, operation in enumerate(operations):
+            op = operation.get('op')
+            product_id = int(operation['product_id'])
+            product = products.get(product_id)
+
+            if op == 'remove':
+                if cart.remove(product_id) is not None:
+                    changed[product_id] = True
+                continue
+            if op not in ('add', 'update'):
+                errors.append({'index': index, 'error': f'Operación no válida: {op}'})
+                continue
+            if product is None:
+                errors.append({'index': index, 'error': 'Producto no encontrado'})
+                continue
+
+            quantity = int(operation.get('quantity', 1))
+            # Se valida antes de sumar: un "add" negativo no debe descontar del carrito
+            if quantity < 1:
+                errors.append({'index': index, 'error': 'La cantidad debe ser mayor a 0'})
+                continue
+            if op == 'add' and product_id in cart:
+                quantity += cart.get(product_id)['quantity']
+            if quantity > product.stock:
+                errors.append({
+                    'index': index,
+                    'error': f'Stock insuficiente para {product.name}. Stock disponible: {product.stock}'
+                })
+                continue
+
+            item = cart.get(product_id)
+            if item:
+                cart.set(product_id, item['name'], item['price'], quantity)
+            else:
+                cart.set(product_id, product.name, product.sale_price, quantity)
+            changed[product_id] = True
+
+        if errors:
+            return JsonResponse({'error': 'No se aplicó ninguna operación', 'errors': errors}, status=400)
+
+        cart.save()
+
+        return JsonResponse({
+            'success': True,
+            'changed': [cart.get(product_id) for product_id in changed if product_id in cart],
+            'removed': [product_id for product_id in changed if product_id not in cart],
+            'count': len(cart),
+            'total': cart.total
+        })
+
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'Datos inválidos'}, status=400)
 
 @require_http_methods(["POST"])
 def init_cart(request):
     try:
         data = json.loads(request.body)
-        cart = data.get('cart', [])
-        request.session['cart'] = cart
-        return JsonResponse({'success': True, 'cart': cart})
+        cart = Cart(request)
+        cart.replace(data.get('cart', []))
+        cart.save()
+        return JsonResponse({'success': True, 'cart': cart.items()})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
\ No newline at end of file
@@ -0,0 +1,139 @@
+import logging
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class Cart:
+    """Carrito de venta indexado por producto con total acumulado.
+
+    Se guarda en el caché configurado en CART_CACHE_ALIAS (archivo,
+    locmem o Redis) en vez de la tabla de sesiones, de modo que cada
+    cambio del carrito no se traduce en un UPDATE de ``django_session``.
+    Si el caché no está disponible se usa la sesión como respaldo.
+
+    La clave del caché es un identificador guardado en la sesión y no la
+    clave de la sesión, que cambia al iniciar sesión.
+
+        cart = Cart(request)
+        cart.set(product.pk, product.name, product.sale_price, 2)
+        cart.save()
+    """
+
+    session_key = 'cart'
+    cart_id_key = 'cart_id'
+
+    def __init__(self, request):
+        self.request = request
+        self.lines = {}
+        self.total = 0
+        self.modified = False
+        self.use_cache = True
+        self.load()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'CART_CACHE_ALIAS', 'default')]
+
+    @property
+    def cache_key(self):
+        session = self.request.session
+        cart_id = session.get(self.cart_id_key)
+        if cart_id is None:
+            cart_id = session[self.cart_id_key] = uuid.uuid4().hex
+        return f'cart:{cart_id}'
+
+    def load(self):
+        try:
+            data = self.cache.get(self.cache_key)
+        except Exception:
+            logger.exception("Caché de carritos no disponible, usando la sesión")
+            data = None
+            self.use_cache = False
+        if data is None:
+            # Respaldo en la sesión (base de datos)
+            self.replace(self.request.session.get(self.session_key, []))
+            self.modified = False
+        else:
+            self.lines = data['lines']
+            self.total = data['total']
+
+    def save(self):
+        """Persiste el carrito con una sola escritura si hubo cambios"""
+        if not self.modified:
+            return
+        if not self.use_cache:
+            self.save_to_session()
+            return
+        try:
+            self.cache.set(
+                self.cache_key,
+                {'lines': self.lines, 'total': self.total},
+                getattr(settings, 'CART_TIMEOUT', settings.SESSION_COOKIE_AGE),
+            )
+        except Exception:
+            logger.exception("Caché de carritos no disponible, usando la sesión")
+            self.save_to_session()
+            return
+        if self.session_key in self.request.session:
+            del self.request.session[self.session_key]
+        self.modified = False
+
+    def save_to_session(self):
+        if self.modified:
+            self.request.session[self.session_key] = self.items()
+            self.modified = False
+
+    def items(self):
+        return list(self.lines.values())
+
+    def get(self, product_id):
+        return self.lines.get(int(product_id))
+
+    def __contains__(self, product_id):
+        return int(product_id) in self.lines
+
+    def __len__(self):
+        return len(self.lines)
+
+    def set(self, product_id, name, price, quantity):
+        """Agrega o reemplaza una línea manteniendo el total acumulado"""
+        product_id = int(product_id)
+        previous = self.lines.get(product_id)
+        if previous is not None:
+            self.total -= previous['price'] * previous['quantity']
+        self.lines[product_id] = {
+            'product_id': product_id,
+            'name': name,
+            'quantity': quantity,
+            'price': price
+        }
+        self.total += price * quantity
+        self.modified = True
+        return self.lines[product_id]
+
+    def remove(self, product_id):
+        item = self.lines.pop(int(product_id), None)
+        if item is not None:
+            self.total -= item['price'] * item['quantity']
+            self.modified = True
+        return item
+
+    def replace(self, items):
+        self.lines = {}
+        self.total = 0
+        for item in items:
+            quantity = int(item['quantity'])
+            existing = self.get(item['product_id'])
+            if existing:
+                quantity += existing['quantity']
+            self.set(item['product_id'], item.get('name', ''), int(item['price']), quantity)
+        self.modified = True
+
+    def clear(self):
+        self.replace([])
+
+    def as_json(self):
+        return {'cart': self.items(), 'total': self.total}
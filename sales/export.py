@@ -0,0 +1,83 @@
+import csv
+import json
+from itertools import groupby
+from django.utils import timezone
+from core.streaming import Echo
+from .filters import filter_sales
+from .models import Sale
+
+# Filas leídas por viaje al servidor (cursor del lado del servidor en PostgreSQL)
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+SALE_COLUMNS = [
+    ('id', 'venta_id'),
+    ('number', 'numero'),
+    ('date', 'fecha'),
+    ('status', 'estado'),
+    ('payment_method', 'metodo_pago'),
+    ('user__username', 'usuario'),
+    ('total', 'total'),
+    ('net_profit', 'ganancia_neta'),
+]
+
+LINE_COLUMNS = [
+    ('saledetail__product_id', 'producto_id'),
+    ('saledetail__product__name', 'producto'),
+    ('saledetail__quantity', 'cantidad'),
+    ('saledetail__unit_price', 'precio_unitario'),
+    ('saledetail__subtotal', 'subtotal'),
+    ('saledetail__is_tax_included', 'incluye_iva'),
+    ('saledetail__net_profit', 'ganancia_linea'),
+]
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Una fila por línea de venta (o por venta sin líneas), en orden cronológico.
+
+    Es una sola consulta con LEFT JOIN a los detalles que se recorre con
+    ``iterator()``: la memoria usada no depende del total de ventas.
+    """
+    fields = [field for field, _ in SALE_COLUMNS + LINE_COLUMNS]
+    rows = queryset.order_by('date', 'id', 'saledetail__id').values_list(*fields)
+    for row in rows.iterator(chunk_size=chunk_size):
+        row = dict(zip(fields, row))
+        row['date'] = timezone.localtime(row['date']).isoformat()
+        yield row
+
+
+def stream_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    columns = SALE_COLUMNS + LINE_COLUMNS
+    yield writer.writerow([label for _, label in columns])
+    for row in export_rows(queryset, chunk_size):
+        yield writer.writerow(['' if row[field] is None else row[field] for field, _ in columns])
+
+
+def stream_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Un objeto JSON por venta con sus líneas anidadas, uno por renglón"""
+    for _, rows in groupby(export_rows(queryset, chunk_size), key=lambda row: row['id']):
+        rows = list(rows)
+        sale = {label: rows[0][field] for field, label in SALE_COLUMNS}
+        sale['lineas'] = [
+            {label: row[field] for field, label in LINE_COLUMNS}
+            for row in rows
+            if row['saledetail__product_id'] is not None
+        ]
+        yield json.dumps(sale, ensure_ascii=False) + '\n'
+
+
+def stream_sales(queryset, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generador de texto con las ventas en el formato indicado ('csv' o 'ndjson')"""
+    if export_format == 'ndjson':
+        return stream_ndjson(queryset, chunk_size)
+    return stream_csv(queryset, chunk_size)
+
+
+def export_queryset(params):
+    """Ventas a exportar con los mismos filtros del listado"""
+    return filter_sales(Sale.objects.all(), params)
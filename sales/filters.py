@@ -0,0 +1,29 @@
+from datetime import timedelta
+from core.dates import parse_date, start_of_day
+
+# Parámetros de filtro que comparten el listado y la exportación de ventas
+FILTER_PARAMS = ('date', 'date_from', 'date_to', 'status', 'payment_method')
+
+
+def filter_sales(queryset, params):
+    """Aplica los filtros del listado de ventas a partir de un dict de parámetros.
+
+    ``date`` filtra un día y ``date_from``/``date_to`` un rango de días
+    (ambos incluidos). Las fechas se convierten en rangos semiabiertos
+    sobre ``date`` para que la consulta use los índices.
+    """
+    day = parse_date(params.get('date'))
+    date_from = parse_date(params.get('date_from')) or day
+    date_to = parse_date(params.get('date_to')) or day
+    status = params.get('status')
+    payment_method = params.get('payment_method')
+
+    if date_from:
+        queryset = queryset.filter(date__gte=start_of_day(date_from))
+    if date_to:
+        queryset = queryset.filter(date__lt=start_of_day(date_to + timedelta(days=1)))
+    if status:
+        queryset = queryset.filter(status=status)
+    if payment_method:
+        queryset = queryset.filter(payment_method=payment_method)
+    return queryset
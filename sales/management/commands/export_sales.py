@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.dates import parse_date
+from sales.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_queryset, stream_sales
+from sales.models import Sale
+
+
+class Command(BaseCommand):
+    help = "Exporta las ventas y sus líneas como CSV o NDJSON sin cargarlas en memoria"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help="Archivo de salida; por defecto, la salida estándar")
+        parser.add_argument('--date-from', help="Primer día incluido (AAAA-MM-DD)")
+        parser.add_argument('--date-to', help="Último día incluido (AAAA-MM-DD)")
+        parser.add_argument('--status', choices=[value for value, _ in Sale.SALE_STATUS])
+        parser.add_argument('--payment-method', choices=[value for value, _ in Sale.PAYMENT_CHOICES])
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help="Filas por lectura")
+
+    def handle(self, *args, **options):
+        params = {
+            'date_from': options['date_from'],
+            'date_to': options['date_to'],
+            'status': options['status'],
+            'payment_method': options['payment_method'],
+        }
+        for name in ('date_from', 'date_to'):
+            if params[name] and parse_date(params[name]) is None:
+                raise CommandError(f"Fecha inválida para --{name.replace('_', '-')}: {params[name]}")
+
+        chunks = stream_sales(export_queryset(params), options['format'], max(options['chunk_size'], 1))
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(chunks)
+        self.stderr.write(self.style.SUCCESS(f"Ventas exportadas a {options['output']}"))
@@ -0,0 +1,43 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from core.dates import parse_date
+from sales.models import DailySalesRollup, Sale
+
+
+class Command(BaseCommand):
+    help = "Recalcula el resumen diario de ventas para un rango de fechas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="Primer día (AAAA-MM-DD); por defecto, la primera venta")
+        parser.add_argument('--end', help="Último día incluido (AAAA-MM-DD); por defecto, hoy")
+        parser.add_argument('--batch-days', type=int, default=31, help="Días por transacción")
+
+    def handle(self, *args, **options):
+        start = self.parse_option(options, 'start')
+        end = self.parse_option(options, 'end') or timezone.localdate()
+        if start is None:
+            first = Sale.objects.aggregate(first=Min('date'))['first']
+            if first is None:
+                self.stdout.write("No hay ventas registradas")
+                return
+            start = timezone.localdate(first)
+        if start > end:
+            raise CommandError("La fecha inicial es posterior a la final")
+
+        created = DailySalesRollup.objects.rebuild(
+            start, end + timedelta(days=1), batch_days=max(options['batch_days'], 1)
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Resumen recalculado del {start} al {end}: {created} fila(s)"
+        ))
+
+    def parse_option(self, options, name):
+        value = options[name]
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Fecha inválida para --{name}: {value}")
+        return day
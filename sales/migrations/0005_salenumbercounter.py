@@ -0,0 +1,37 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:35
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField, Max
+from django.db.models.functions import Cast, Substr
+
+
+def seed_counter(apps, schema_editor):
+    Sale = apps.get_model('sales', 'Sale')
+    SaleNumberCounter = apps.get_model('sales', 'SaleNumberCounter')
+    last_value = Sale.objects.filter(number__startswith='VTA-').aggregate(
+        value=Max(Cast(Substr('number', 5), BigIntegerField()))
+    )['value'] or 0
+    SaleNumberCounter.objects.create(name='sale', last_value=last_value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_sale_is_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Nombre')),
+                ('last_value', models.BigIntegerField(default=0, verbose_name='Último valor asignado')),
+            ],
+            options={
+                'verbose_name': 'Contador de ventas',
+                'verbose_name_plural': 'Contadores de ventas',
+            },
+        ),
+        migrations.RunPython(seed_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:36
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def line_profit(detail):
+    sale_price_net = detail.unit_price / 1.19 if detail.is_tax_included else detail.unit_price
+    purchase_price_net = detail.purchase_price / 1.19 if detail.product.is_purchase_with_tax else detail.purchase_price
+    return int((sale_price_net - purchase_price_net) * detail.quantity)
+
+
+def backfill_summary(apps, schema_editor):
+    Sale = apps.get_model('sales', 'Sale')
+    SaleDetail = apps.get_model('sales', 'SaleDetail')
+    last_id = 0
+    while True:
+        sales = list(Sale.objects.filter(pk__gt=last_id).order_by('pk')[:BATCH_SIZE])
+        if not sales:
+            break
+        last_id = sales[-1].pk
+        summary = {sale.pk: [0, 0, 0] for sale in sales}
+        details = SaleDetail.objects.filter(sale_id__in=summary).select_related('product')
+        for detail in details:
+            row = summary[detail.sale_id]
+            row[0] += 1
+            row[1] += detail.quantity
+            row[2] += line_profit(detail)
+        for sale in sales:
+            sale.item_count, sale.units_total, sale.net_profit = summary[sale.pk]
+        Sale.objects.bulk_update(sales, ['item_count', 'units_total', 'net_profit'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0005_salenumbercounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='item_count',
+            field=models.IntegerField(default=0, verbose_name='Cantidad de productos'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='net_profit',
+            field=models.IntegerField(default=0, verbose_name='Ganancia neta'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='units_total',
+            field=models.IntegerField(default=0, verbose_name='Unidades vendidas'),
+        ),
+        migrations.RunPython(backfill_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:37
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+BATCH_SIZE = 1000
+GROSS_PERCENT = 119
+
+
+def net_amount(amount, with_tax):
+    if not with_tax:
+        return amount
+    return (amount * 100 + GROSS_PERCENT // 2) // GROSS_PERCENT
+
+
+def backfill_snapshot(apps, schema_editor):
+    Sale = apps.get_model('sales', 'Sale')
+    SaleDetail = apps.get_model('sales', 'SaleDetail')
+    last_id = 0
+    while True:
+        details = list(
+            SaleDetail.objects.filter(pk__gt=last_id).select_related('product').order_by('pk')[:BATCH_SIZE]
+        )
+        if not details:
+            break
+        last_id = details[-1].pk
+        for detail in details:
+            detail.is_purchase_with_tax = detail.product.is_purchase_with_tax
+            detail.net_unit_cost = net_amount(detail.purchase_price, detail.is_purchase_with_tax)
+            detail.net_profit = (
+                net_amount(detail.subtotal, detail.is_tax_included)
+                - net_amount(detail.purchase_price * detail.quantity, detail.is_purchase_with_tax)
+            )
+        SaleDetail.objects.bulk_update(details, ['is_purchase_with_tax', 'net_unit_cost', 'net_profit'])
+
+        # Mantener el resumen de la venta alineado con los nuevos valores enteros
+        profits = SaleDetail.objects.filter(
+            sale_id__in={detail.sale_id for detail in details}
+        ).values('sale_id').annotate(total=Sum('net_profit'))
+        sales = []
+        for row in profits:
+            sale = Sale(pk=row['sale_id'], net_profit=row['total'])
+            sales.append(sale)
+        Sale.objects.bulk_update(sales, ['net_profit'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_sale_summary_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saledetail',
+            name='is_purchase_with_tax',
+            field=models.BooleanField(default=True, verbose_name='Compra incluye IVA'),
+        ),
+        migrations.AddField(
+            model_name='saledetail',
+            name='net_profit',
+            field=models.IntegerField(default=0, verbose_name='Ganancia neta'),
+        ),
+        migrations.AddField(
+            model_name='saledetail',
+            name='net_unit_cost',
+            field=models.IntegerField(default=0, verbose_name='Costo unitario neto'),
+        ),
+        migrations.RunPython(backfill_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_saledetail_net_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Versión'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_sale_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['-date', '-id'], name='sale_date_id_idx'),
+        ),
+    ]
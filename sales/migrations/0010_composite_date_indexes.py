@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_cursor_pagination_indexes'),
+        ('sales', '0009_cursor_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['status', 'date'], name='sale_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saledetail',
+            index=models.Index(fields=['sale', 'product'], name='saledetail_sale_product_idx'),
+        ),
+        migrations.AlterField(
+            model_name='saledetail',
+            name='sale',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='sales.sale', verbose_name='Venta'),
+        ),
+    ]
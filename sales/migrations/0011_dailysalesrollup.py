@@ -0,0 +1,82 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+GROSS_PERCENT = 119
+
+
+def net_amount(amount, with_tax):
+    if not with_tax:
+        return amount
+    return (amount * 100 + GROSS_PERCENT // 2) // GROSS_PERCENT
+
+
+def backfill_rollup(apps, schema_editor):
+    Sale = apps.get_model('sales', 'Sale')
+    SaleDetail = apps.get_model('sales', 'SaleDetail')
+    DailySalesRollup = apps.get_model('sales', 'DailySalesRollup')
+    rollup = {}
+    last_id = 0
+    while True:
+        sales = list(
+            Sale.objects.filter(pk__gt=last_id, status='COMPLETED').order_by('pk')
+            .values('pk', 'date', 'payment_method', 'user_id')[:BATCH_SIZE]
+        )
+        if not sales:
+            break
+        last_id = sales[-1]['pk']
+        sales = {sale['pk']: sale for sale in sales}
+        details = SaleDetail.objects.filter(sale_id__in=sales).values(
+            'sale_id', 'product_id', 'quantity', 'subtotal', 'is_tax_included', 'net_profit'
+        )
+        for detail in details:
+            sale = sales[detail['sale_id']]
+            key = (timezone.localdate(sale['date']), detail['product_id'], sale['payment_method'], sale['user_id'])
+            row = rollup.setdefault(key, [0, 0, 0, 0])
+            row[0] += detail['quantity']
+            row[1] += detail['subtotal']
+            row[2] += net_amount(detail['subtotal'], detail['is_tax_included'])
+            row[3] += detail['net_profit']
+    DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(
+            day=day, product_id=product_id, payment_method=payment_method, user_id=user_id,
+            units=units, gross=gross, net_revenue=net_revenue, net_profit=net_profit
+        )
+        for (day, product_id, payment_method, user_id), (units, gross, net_revenue, net_profit) in rollup.items()
+    ], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_cursor_pagination_indexes'),
+        ('sales', '0010_composite_date_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Día')),
+                ('payment_method', models.CharField(choices=[('CASH', 'Efectivo'), ('TRANSFER', 'Transferencia'), ('DEBIT', 'Tarjeta Débito'), ('CREDIT', 'Tarjeta Crédito')], max_length=10, verbose_name='Método de pago')),
+                ('units', models.IntegerField(default=0, verbose_name='Unidades')),
+                ('gross', models.IntegerField(default=0, verbose_name='Venta bruta')),
+                ('net_revenue', models.IntegerField(default=0, verbose_name='Venta neta')),
+                ('net_profit', models.IntegerField(default=0, verbose_name='Ganancia neta')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product', verbose_name='Producto')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Vendedor')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario de ventas',
+                'verbose_name_plural': 'Resúmenes diarios de ventas',
+                'constraints': [models.UniqueConstraint(fields=('day', 'product', 'payment_method', 'user'), name='daily_sales_rollup_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
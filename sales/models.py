@@ -1,8 +1,164 @@
-from django.db import models
+import threading
+from datetime import timedelta
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import models, connection, IntegrityError, transaction
+from django.db.models import BigIntegerField, Count, F, Max, Sum
+from django.db.models.functions import Cast, Substr, TruncDate
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from products.models import Product
+from django.utils import timezone
+from core.dates import start_of_day
+from dashboard import cache as dashboard_cache
+from products.models import Product, net_amount, net_amount_expression
 from django.core.exceptions import ValidationError
 
+SALE_NUMBER_PREFIX = 'VTA-'
+
+
+def format_sale_number(value):
+    """Formatea un correlativo como número de venta (VTA-00001)"""
+    return f'{SALE_NUMBER_PREFIX}{str(value).zfill(5)}'
+
+
+class SaleNumberCounterManager(models.Manager):
+    def allocate(self, size=1, name='sale'):
+        """Reserva `size` correlativos consecutivos y retorna el último.
+
+        Es una sola sentencia que incrementa la fila del contador, por lo
+        que dos cajas nunca obtienen el mismo número.
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {self.model._meta.db_table} '
+                    'SET last_value = last_value + %s WHERE name = %s RETURNING last_value',
+                    [size, name],
+                )
+                row = cursor.fetchone()
+            if row:
+                return row[0]
+        else:
+            with transaction.atomic():
+                if self.filter(name=name).update(last_value=F('last_value') + size):
+                    return self.filter(name=name).values_list('last_value', flat=True).get()
+
+        # Primera asignación: el contador parte desde la última venta existente
+        try:
+            with transaction.atomic():
+                counter = self.create(name=name, last_value=Sale.current_max_number() + size)
+            return counter.last_value
+        except IntegrityError:
+            # Otro proceso creó el contador en paralelo
+            return self.allocate(size=size, name=name)
+
+
+class SaleNumberCounter(models.Model):
+    name = models.CharField(max_length=50, unique=True, verbose_name="Nombre")
+    last_value = models.BigIntegerField(default=0, verbose_name="Último valor asignado")
+
+    objects = SaleNumberCounterManager()
+
+    class Meta:
+        verbose_name = "Contador de ventas"
+        verbose_name_plural = "Contadores de ventas"
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+
+class SaleNumberBlock:
+    """Bloque de correlativos reservado por este proceso.
+
+    Con SALE_NUMBER_BLOCK_SIZE > 1 cada worker reserva varios números de
+    una vez y los entrega desde memoria; los números siguen siendo únicos,
+    pero entre workers pueden quedar desordenados o con huecos.
+
+    La reserva se hace dentro de la transacción de quien llama, así que el
+    resto del bloque sólo se guarda en memoria cuando esa transacción se
+    confirma: si se revierte, el contador vuelve atrás y esos números no
+    deben entregarse.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_value = 0
+        self.last_value = -1
+
+    def take(self):
+        size = max(int(getattr(settings, 'SALE_NUMBER_BLOCK_SIZE', 1)), 1)
+        with self.lock:
+            if self.next_value <= self.last_value:
+                value = self.next_value
+                self.next_value += 1
+                return value
+        last_value = SaleNumberCounter.objects.allocate(size)
+        value = last_value - size + 1
+        if size > 1:
+            transaction.on_commit(lambda: self.store(value + 1, last_value))
+        return value
+
+    def store(self, next_value, last_value):
+        """Guarda el resto de un bloque cuya reserva ya quedó confirmada"""
+        with self.lock:
+            self.next_value, self.last_value = next_value, last_value
+
+
+sale_number_block = SaleNumberBlock()
+
+# Ventas cuyo resumen quedó pendiente dentro de un bloque deferred_summary()
+_deferred_sales = ContextVar('deferred_sales', default=None)
+
+
+class SaleManager(models.Manager):
+    def summaries(self, sale_ids):
+        """Calcula con un solo GROUP BY el resumen de las ventas indicadas"""
+        summaries = {
+            sale_id: {'total': 0, 'item_count': 0, 'units_total': 0, 'net_profit': 0}
+            for sale_id in sale_ids
+        }
+        rows = SaleDetail.objects.filter(sale_id__in=sale_ids).values('sale_id').annotate(
+            total=Sum('subtotal'),
+            item_count=Count('id'),
+            units_total=Sum('quantity'),
+            net_profit=Sum('net_profit'),
+        )
+        for row in rows:
+            summaries[row.pop('sale_id')] = row
+        return summaries
+
+    def refresh_summaries(self, sale_ids):
+        """Recalcula y guarda el total y las columnas resumen de varias ventas"""
+        summaries = self.summaries(sale_ids)
+        sales = [self.model(pk=sale_id, **summary) for sale_id, summary in summaries.items()]
+        self.bulk_update(sales, list(Sale.SUMMARY_FIELDS))
+
+    @contextmanager
+    def deferred_summary(self):
+        """Suspende el recálculo del total en cada SaleDetail.save().
+
+        Las ventas tocadas dentro del bloque se recalculan una sola vez al
+        salir, con un agregado en la base de datos:
+
+            with Sale.objects.deferred_summary():
+                for item in items:
+                    SaleDetail.objects.create(...)
+        """
+        if _deferred_sales.get() is not None:
+            # Bloque anidado: el externo hace el recálculo
+            yield
+            return
+        pending = set()
+        token = _deferred_sales.set(pending)
+        try:
+            yield
+        finally:
+            _deferred_sales.reset(token)
+        if pending:
+            self.refresh_summaries(pending)
+
+
+
 class Sale(models.Model):
     PAYMENT_CHOICES = [
         ('CASH', 'Efectivo'),
@@ -17,6 +173,9 @@ class Sale(models.Model):
         ('CANCELLED', 'Anulada'),
     ]
 
+    # Columnas derivadas de los detalles de la venta
+    SUMMARY_FIELDS = ('total', 'item_count', 'units_total', 'net_profit')
+
     number = models.CharField(max_length=10, unique=True, verbose_name="Número de venta")
     date = models.DateTimeField(auto_now_add=True, verbose_name="Fecha y hora")
     payment_method = models.CharField(
@@ -40,11 +199,23 @@ class Sale(models.Model):
     created = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de creación")
     updated = models.DateTimeField(auto_now=True, verbose_name="Última actualización")
     is_modified = models.BooleanField(default=False, verbose_name="Modificada")
+    item_count = models.IntegerField(default=0, verbose_name="Cantidad de productos")
+    units_total = models.IntegerField(default=0, verbose_name="Unidades vendidas")
+    net_profit = models.IntegerField(default=0, verbose_name="Ganancia neta")
+    version = models.PositiveIntegerField(default=0, verbose_name="Versión")
+
+    objects = SaleManager()
 
     class Meta:
         verbose_name = "Venta"
         verbose_name_plural = "Ventas"
         ordering = ['-date']
+        indexes = [
+            # Paginación por cursor del listado de ventas
+            models.Index(fields=['-date', '-id'], name='sale_date_id_idx'),
+            # Totales por período del dashboard y listado filtrado por estado
+            models.Index(fields=['status', 'date'], name='sale_status_date_idx'),
+        ]
 
     def __str__(self):
         return f"Venta #{self.number}"
@@ -53,22 +224,37 @@ class Sale(models.Model):
         return self.saledetail_set.count()
 
     def calculate_total(self):
-        return sum(detail.subtotal for detail in self.saledetail_set.all())
+        return self.saledetail_set.aggregate(total=Sum('subtotal'))['total'] or 0
 
     def calculate_profit(self):
-        """Calcula la ganancia total de la venta"""
-        return sum(detail.calculate_profit() for detail in self.saledetail_set.all())
+        """Calcula la ganancia total de la venta en la base de datos"""
+        return self.saledetail_set.aggregate(total=Sum('net_profit'))['total'] or 0
+
+    def apply_summary(self, details):
+        """Asigna total, cantidad de líneas, unidades y ganancia a partir de los detalles"""
+        details = list(details)
+        self.total = sum(detail.subtotal for detail in details)
+        self.item_count = len(details)
+        self.units_total = sum(detail.quantity for detail in details)
+        self.net_profit = sum(detail.calculate_profit() for detail in details)
+
+    def refresh_summary(self):
+        """Recalcula y guarda las columnas resumen desde la base de datos"""
+        for field, value in Sale.objects.summaries([self.pk])[self.pk].items():
+            setattr(self, field, value)
+        self.save(update_fields=[*self.SUMMARY_FIELDS, 'updated'])
 
     @staticmethod
     def generate_sale_number():
         """Genera un número único para la venta"""
-        last_sale = Sale.objects.all().order_by('id').last()
-        if not last_sale:
-            return 'VTA-00001'
-        sale_number = last_sale.number
-        sale_int = int(sale_number.split('-')[1])
-        new_sale_int = sale_int + 1
-        return f'VTA-{str(new_sale_int).zfill(5)}'
+        return format_sale_number(sale_number_block.take())
+
+    @staticmethod
+    def current_max_number():
+        """Retorna el mayor correlativo usado por las ventas existentes"""
+        return Sale.objects.filter(number__startswith=SALE_NUMBER_PREFIX).aggregate(
+            value=Max(Cast(Substr('number', len(SALE_NUMBER_PREFIX) + 1), BigIntegerField()))
+        )['value'] or 0
 
     def clean(self):
         """Validaciones del modelo"""
@@ -85,8 +271,27 @@ class Sale(models.Model):
         self.is_modified = True
         self.save()
 
+class SaleDetailQuerySet(models.QuerySet):
+    def with_net_profit(self):
+        """Anota en SQL los montos netos de cada línea con aritmética entera.
+
+        ``net_revenue`` es el subtotal sin IVA, ``net_cost`` el costo de
+        compra sin IVA y ``computed_profit`` su diferencia, la misma fórmula
+        que take_snapshot() guarda en ``net_profit``.
+        """
+        return self.annotate(
+            net_revenue=net_amount_expression('subtotal', 'is_tax_included'),
+            net_cost=net_amount_expression(
+                Cast('purchase_price', BigIntegerField()) * F('quantity'), 'is_purchase_with_tax'
+            ),
+        ).annotate(
+            computed_profit=F('net_revenue') - F('net_cost'),
+        )
+
+
 class SaleDetail(models.Model):
-    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, verbose_name="Venta")
+    # Indexado por saledetail_sale_product_idx (sale es su primera columna)
+    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, db_index=False, verbose_name="Venta")
     product = models.ForeignKey(
         Product, 
         on_delete=models.PROTECT, 
@@ -97,26 +302,200 @@ class SaleDetail(models.Model):
     purchase_price = models.IntegerField(verbose_name="Precio de compra")
     subtotal = models.IntegerField(verbose_name="Subtotal")
     is_tax_included = models.BooleanField(default=True, verbose_name="Incluye IVA")
+    is_purchase_with_tax = models.BooleanField(default=True, verbose_name="Compra incluye IVA")
+    net_unit_cost = models.IntegerField(default=0, verbose_name="Costo unitario neto")
+    net_profit = models.IntegerField(default=0, verbose_name="Ganancia neta")
+
+    objects = SaleDetailQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Detalle de venta"
         verbose_name_plural = "Detalles de venta"
+        indexes = [
+            # Join desde la venta agrupando por producto (dashboard, edición)
+            models.Index(fields=['sale', 'product'], name='saledetail_sale_product_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity} unidades"
 
     def calculate_profit(self):
-        """Calcula la ganancia de esta línea de venta"""
-        sale_price_net = self.unit_price / 1.19 if self.is_tax_included else self.unit_price
-        purchase_price_net = self.purchase_price / 1.19 if self.product.is_purchase_with_tax else self.purchase_price
-        return int((sale_price_net - purchase_price_net) * self.quantity)
+        """Retorna la ganancia neta de esta línea de venta"""
+        return self.net_profit
 
-    def save(self, *args, **kwargs):
-        # Calcula el subtotal antes de guardar
+    def take_snapshot(self, product=None):
+        """Congela los valores netos de la línea al momento de registrarla.
+
+        El indicador de IVA de compra se copia del producto sólo la primera
+        vez; luego la línea no cambia aunque el producto se edite.
+        """
+        if product is not None:
+            self.is_purchase_with_tax = product.is_purchase_with_tax
         self.subtotal = self.quantity * self.unit_price
+        self.net_unit_cost = net_amount(self.purchase_price, self.is_purchase_with_tax)
+        self.net_profit = (
+            net_amount(self.subtotal, self.is_tax_included)
+            - net_amount(self.purchase_price * self.quantity, self.is_purchase_with_tax)
+        )
+
+    def save(self, *args, **kwargs):
+        # Calcula subtotal y valores netos antes de guardar
+        self.take_snapshot(self.product if self._state.adding else None)
         super().save(*args, **kwargs)
+        self.sale_changed()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.sale_changed()
+        return result
+
+    def sale_changed(self):
+        """Actualiza el resumen de la venta, o lo difiere si hay un bloque activo"""
+        pending = _deferred_sales.get()
+        if pending is not None:
+            pending.add(self.sale_id)
+        elif self.sale.pk:
+            self.sale.refresh_summary()
+
 
-        # Revisar que la venta ya exista en la base de datos antes de actualizar el total
-        if self.sale.pk:
-            self.sale.total = self.sale.calculate_total()
-            self.sale.save()
+class DailySalesRollupManager(models.Manager):
+    def contributions(self, sale, details, sign=1, changes=None):
+        """Acumula en ``changes`` el aporte de las líneas de una venta completada.
+
+        Las claves son (día, producto, medio de pago, vendedor) y los
+        valores las columnas de ROLLUP_FIELDS; ``sign=-1`` resta el aporte.
+        """
+        changes = {} if changes is None else changes
+        day = timezone.localdate(sale.date)
+        for detail in details:
+            key = (day, detail.product_id, sale.payment_method, sale.user_id)
+            values = changes.setdefault(key, [0] * len(DailySalesRollup.ROLLUP_FIELDS))
+            values[0] += sign * detail.quantity
+            values[1] += sign * detail.subtotal
+            values[2] += sign * net_amount(detail.subtotal, detail.is_tax_included)
+            values[3] += sign * detail.net_profit
+        return changes
+
+    def apply(self, changes):
+        """Suma las diferencias a las filas del resumen con una lectura y una escritura.
+
+        Las filas existentes se bloquean antes de sumar; las que quedan en
+        cero se eliminan. Si otra transacción insertó la misma clave entre
+        la lectura y la inserción, se vuelve a aplicar sobre la fila nueva.
+        """
+        changes = {key: values for key, values in changes.items() if any(values)}
+        if not changes:
+            return
+        dashboard_cache.changed(dashboard_cache.SALES)
+        condition = models.Q()
+        for day, product_id, payment_method, user_id in changes:
+            condition |= models.Q(day=day, product_id=product_id, payment_method=payment_method, user_id=user_id)
+        rows = {
+            (row.day, row.product_id, row.payment_method, row.user_id): row
+            for row in self.select_for_update().filter(condition).order_by('pk')
+        }
+
+        to_create, to_update, to_delete = [], [], []
+        for key, values in changes.items():
+            row = rows.get(key)
+            if row is None:
+                day, product_id, payment_method, user_id = key
+                row = self.model(day=day, product_id=product_id, payment_method=payment_method, user_id=user_id)
+                to_create.append(key)
+            for field, value in zip(DailySalesRollup.ROLLUP_FIELDS, values):
+                setattr(row, field, getattr(row, field) + value)
+            if key in rows:
+                if any(getattr(row, field) for field in DailySalesRollup.ROLLUP_FIELDS):
+                    to_update.append(row)
+                else:
+                    to_delete.append(row.pk)
+            else:
+                rows[key] = row
+
+        if to_update:
+            self.bulk_update(to_update, list(DailySalesRollup.ROLLUP_FIELDS))
+        if to_delete:
+            self.filter(pk__in=to_delete).delete()
+        if to_create:
+            try:
+                with transaction.atomic():
+                    self.bulk_create([rows[key] for key in to_create])
+            except IntegrityError:
+                self.apply({key: changes[key] for key in to_create})
+
+    def rebuild(self, start, end, batch_days=31):
+        """Recalcula el resumen de los días [start, end) desde los detalles.
+
+        Procesa ``batch_days`` días por transacción: borra las filas del
+        tramo y las vuelve a insertar con un solo GROUP BY. Retorna la
+        cantidad de filas generadas.
+        """
+        dashboard_cache.changed(dashboard_cache.SALES)
+        created = 0
+        while start < end:
+            batch_end = min(start + timedelta(days=batch_days), end)
+            rows = SaleDetail.objects.with_net_profit().filter(
+                sale__status='COMPLETED',
+                sale__date__gte=start_of_day(start),
+                sale__date__lt=start_of_day(batch_end),
+            ).values(
+                'product_id', 'sale__payment_method', 'sale__user_id', sale_day=TruncDate('sale__date')
+            ).annotate(
+                units=Sum('quantity'),
+                gross=Sum('subtotal'),
+                net_revenue_total=Sum('net_revenue'),
+                profit=Sum('net_profit'),
+            ).order_by()
+            with transaction.atomic():
+                self.filter(day__gte=start, day__lt=batch_end).delete()
+                batch = self.bulk_create([
+                    self.model(
+                        day=row['sale_day'],
+                        product_id=row['product_id'],
+                        payment_method=row['sale__payment_method'],
+                        user_id=row['sale__user_id'],
+                        units=row['units'],
+                        gross=row['gross'],
+                        net_revenue=row['net_revenue_total'],
+                        net_profit=row['profit'],
+                    )
+                    for row in rows
+                ], batch_size=1000)
+            created += len(batch)
+            start = batch_end
+        return created
+
+
+class DailySalesRollup(models.Model):
+    """Resumen diario de ventas completadas por producto, medio de pago y vendedor.
+
+    Se mantiene al completar, editar o anular ventas (ver sales.services)
+    y el dashboard lo consulta en lugar de recorrer todas las ventas.
+    ``rebuild_sales_rollup`` lo recalcula para un rango de fechas.
+    """
+    # Columnas acumuladas, en el orden que usa DailySalesRollupManager
+    ROLLUP_FIELDS = ('units', 'gross', 'net_revenue', 'net_profit')
+
+    day = models.DateField(verbose_name="Día")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Producto")
+    payment_method = models.CharField(max_length=10, choices=Sale.PAYMENT_CHOICES, verbose_name="Método de pago")
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, verbose_name="Vendedor")
+    units = models.IntegerField(default=0, verbose_name="Unidades")
+    gross = models.IntegerField(default=0, verbose_name="Venta bruta")
+    net_revenue = models.IntegerField(default=0, verbose_name="Venta neta")
+    net_profit = models.IntegerField(default=0, verbose_name="Ganancia neta")
+
+    objects = DailySalesRollupManager()
+
+    class Meta:
+        verbose_name = "Resumen diario de ventas"
+        verbose_name_plural = "Resúmenes diarios de ventas"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'product', 'payment_method', 'user'],
+                name='daily_sales_rollup_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.product_id}: {self.units} unidades"
@@ -0,0 +1,560 @@
+from functools import wraps
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+from products.models import Product, StockMovement
+from products import search_index
+from products.invalidation import products_changed
+from dashboard import cache as dashboard_cache
+from .models import DailySalesRollup, Sale, SaleDetail
+
+
+class InsufficientStockError(ValidationError):
+    """Error de stock que informa todas las líneas sin stock suficiente a la vez"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__([
+            f"Stock insuficiente para {item['name']} "
+            f"(solicitado: {item['requested']}, disponible: {item['available']})"
+            for item in shortages
+        ])
+
+
+class SaleConflictError(Exception):
+    """La venta fue modificada por otra operación entre la lectura y la escritura"""
+
+
+# Transiciones de estado permitidas para una venta
+TRANSITIONS = {
+    'PENDING': ('COMPLETED', 'CANCELLED'),
+    'COMPLETED': ('PENDING', 'CANCELLED'),
+    'CANCELLED': (),
+}
+
+MAX_CONFLICT_RETRIES = 3
+
+
+def retry_on_conflict(func):
+    """Ejecuta la operación en una transacción y la reintenta si hubo conflicto de versión"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for _ in range(MAX_CONFLICT_RETRIES):
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except SaleConflictError:
+                continue
+        raise ValidationError("La venta fue modificada por otra operación, intente nuevamente")
+    return wrapper
+
+
+def compare_and_swap(sale, **fields):
+    """Actualiza la venta sólo si su versión no cambió desde que se leyó.
+
+    Es un único ``UPDATE ... WHERE version = n``; si otra operación ganó
+    la carrera no se actualiza ninguna fila y se lanza SaleConflictError.
+    """
+    fields['updated'] = timezone.now()
+    updated = Sale.objects.filter(pk=sale.pk, version=sale.version).update(
+        version=F('version') + 1, **fields
+    )
+    if not updated:
+        raise SaleConflictError(sale.pk)
+    for field, value in fields.items():
+        setattr(sale, field, value)
+    sale.version += 1
+    return sale
+
+
+def check_transition(sale, new_status):
+    """Valida que la venta pueda pasar al nuevo estado"""
+    if new_status not in dict(Sale.SALE_STATUS):
+        raise ValidationError("Estado de venta inválido")
+    if new_status != sale.status and new_status not in TRANSITIONS[sale.status]:
+        raise ValidationError(
+            f"No se puede cambiar una venta {sale.get_status_display().lower()} "
+            f"a {dict(Sale.SALE_STATUS)[new_status].lower()}"
+        )
+    if new_status == 'COMPLETED' and sale.total == 0:
+        raise ValidationError("No se puede completar una venta sin productos")
+
+
+def clean_cart(items):
+    """Valida las líneas del carrito antes de tocar el stock.
+
+    Cada línea debe traer producto, cantidad mayor a 0 y precio no
+    negativo como enteros: una cantidad negativa pasaría el
+    ``stock >= cantidad`` del UPDATE y aumentaría el stock.
+    """
+    if not isinstance(items, (list, tuple)):
+        raise ValidationError("El carrito contiene una línea inválida")
+    lines = []
+    for item in items:
+        try:
+            line = {
+                'product_id': int(item['product_id']),
+                'quantity': int(item['quantity']),
+                'price': int(item['price']),
+            }
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError("El carrito contiene una línea inválida")
+        if line['quantity'] < 1:
+            raise ValidationError("La cantidad debe ser mayor a 0")
+        if line['price'] < 0:
+            raise ValidationError("El precio no puede ser negativo")
+        lines.append(line)
+    return lines
+
+
+def aggregate_quantities(items):
+    """Agrupa las cantidades por producto: {product_id: cantidad}"""
+    quantities = {}
+    for item in items:
+        product_id = int(item['product_id'])
+        quantities[product_id] = quantities.get(product_id, 0) + int(item['quantity'])
+    return quantities
+
+
+def negate(quantities):
+    """Cantidades descontadas como movimientos de stock (negativos)"""
+    return {product_id: -quantity for product_id, quantity in quantities.items()}
+
+
+def quantity_case(quantities):
+    """Expresión CASE que asocia a cada producto su cantidad"""
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def stock_crossed_zero(deltas):
+    """Indica si algún producto quedó sin stock o volvió a tenerlo tras aplicar ``deltas``.
+
+    ``deltas`` son las diferencias de stock ya aplicadas ({product_id: diferencia}).
+    El buscador sólo muestra productos con stock, así que únicamente estos
+    cruces lo invalidan.
+    """
+    emptied = [product_id for product_id, delta in deltas.items() if delta < 0]
+    refilled = {product_id: delta for product_id, delta in deltas.items() if delta > 0}
+    conditions = []
+    if emptied:
+        conditions.append(Q(pk__in=emptied, stock=0))
+    if refilled:
+        # El stock actual es igual a lo devuelto: antes estaba en cero
+        conditions.append(Q(pk__in=refilled, stock=quantity_case(refilled)))
+    if not conditions:
+        return False
+    condition = conditions[0]
+    for other in conditions[1:]:
+        condition |= other
+    return Product.objects.filter(condition).exists()
+
+
+def lock_products(product_ids):
+    """Bloquea y obtiene en una sola consulta los productos indicados.
+
+    Se ordenan por id para que dos cajas bloqueen siempre en el mismo
+    orden y no se produzcan interbloqueos.
+    """
+    products = Product.objects.select_for_update().filter(pk__in=product_ids).order_by('pk')
+    return {product.pk: product for product in products}
+
+
+def find_shortages(products, quantities):
+    """Retorna todas las líneas cuyo stock no alcanza para la cantidad pedida"""
+    shortages = []
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        available = product.stock if product else 0
+        if available < quantity:
+            shortages.append({
+                'product_id': product_id,
+                'name': product.name if product else f'#{product_id}',
+                'requested': quantity,
+                'available': available,
+            })
+    return shortages
+
+
+def deduct_stock(quantities):
+    """Descuenta el stock de todos los productos en una sola sentencia.
+
+    El UPDATE sólo afecta filas con stock suficiente
+    (``stock = stock - qty WHERE stock >= qty``); si alguna fila queda
+    fuera se lanza InsufficientStockError y la transacción se revierte.
+    """
+    if not quantities:
+        return 0
+    required = quantity_case(quantities)
+    updated = Product.objects.filter(
+        pk__in=quantities, stock__gte=required
+    ).update(stock=F('stock') - required)
+    if updated != len(quantities):
+        products = {p.pk: p for p in Product.objects.filter(pk__in=quantities)}
+        raise InsufficientStockError(find_shortages(products, quantities))
+    products_changed(
+        dashboard_cache.STOCK,
+        search=search_index.is_enabled() and stock_crossed_zero(negate(quantities)),
+    )
+    return updated
+
+
+def restore_stock(quantities):
+    """Devuelve stock a todos los productos en una sola sentencia"""
+    if not quantities:
+        return 0
+    updated = Product.objects.filter(pk__in=quantities).update(
+        stock=F('stock') + quantity_case(quantities)
+    )
+    products_changed(
+        dashboard_cache.STOCK,
+        search=search_index.is_enabled() and stock_crossed_zero(quantities),
+    )
+    return updated
+
+
+def build_details(sale, cart, products):
+    """Construye (sin guardar) los detalles de la venta a partir del carrito"""
+    details = []
+    for item in cart:
+        product = products[int(item['product_id'])]
+        quantity = int(item['quantity'])
+        price = int(item['price'])
+        detail = SaleDetail(
+            sale=sale,
+            product=product,
+            quantity=quantity,
+            unit_price=price,
+            purchase_price=product.purchase_price,
+            is_tax_included=product.is_sale_with_tax,
+        )
+        detail.take_snapshot(product)
+        details.append(detail)
+    return details
+
+
+def checkout(cart, user, payment_method, status):
+    """Registra una venta a partir del carrito con un número constante de consultas.
+
+    Bloquea todos los productos en una consulta, informa de una vez
+    todas las líneas sin stock, descuenta el stock con un único UPDATE,
+    inserta los detalles con bulk_create y escribe el total una sola vez.
+    """
+    if not cart:
+        raise ValidationError("No hay productos en el carrito")
+    cart = clean_cart(cart)
+
+    total = sum(int(item['price']) * int(item['quantity']) for item in cart)
+    if total == 0:
+        raise ValidationError("El total de la venta no puede ser 0")
+
+    # El número se reserva fuera de la transacción para no mantener
+    # bloqueado el contador mientras se procesa la venta.
+    number = Sale.generate_sale_number()
+    with transaction.atomic():
+        return _checkout(cart, user, payment_method, status, number, total)
+
+
+def _checkout(cart, user, payment_method, status, number, total):
+    quantities = aggregate_quantities(cart)
+    products = lock_products(quantities)
+    shortages = find_shortages(products, quantities)
+    if shortages:
+        raise InsufficientStockError(shortages)
+
+    deduct_stock(quantities)
+
+    sale = Sale(
+        number=number,
+        payment_method=payment_method,
+        status=status,
+        user=user,
+        total=total,
+        is_stock_deducted=True  # Stock descontado al crear la venta
+    )
+    details = build_details(sale, cart, products)
+    sale.apply_summary(details)
+    sale.full_clean()
+    sale.save()
+
+    SaleDetail.objects.bulk_create(details)
+    StockMovement.objects.record(negate(quantities), 'SALE', sale=sale, user=user)
+    if sale.status == 'COMPLETED':
+        DailySalesRollup.objects.apply(DailySalesRollup.objects.contributions(sale, details))
+    return sale
+
+
+def merge_cart(cart):
+    """Agrupa el carrito por producto conservando el primer precio informado"""
+    merged = {}
+    for item in cart:
+        product_id = int(item['product_id'])
+        if product_id in merged:
+            merged[product_id]['quantity'] += int(item['quantity'])
+        else:
+            merged[product_id] = {'quantity': int(item['quantity']), 'price': int(item['price'])}
+    return merged
+
+
+@retry_on_conflict
+def edit_sale(sale, cart, payment_method, status):
+    """Aplica a una venta existente sólo las diferencias con el nuevo carrito.
+
+    Calcula por producto la diferencia entre el stock que la venta tenía
+    descontado y el que debe quedar descontado, lo ajusta en un único
+    UPDATE y actualiza, inserta o elimina únicamente las líneas que
+    cambiaron. La venta se escribe al final con compare-and-swap sobre
+    su versión; si otra operación la modificó antes, todo se revierte y
+    se reintenta.
+
+    La fila de la venta se bloquea antes que los productos, en el mismo
+    orden que settle_sales, para que ambas no se interbloqueen.
+    """
+    if not cart:
+        raise ValidationError("No hay productos en la venta")
+
+    sale = Sale.objects.select_for_update().get(pk=sale.pk)
+    if sale.status == 'CANCELLED':
+        raise ValidationError("No se puede editar una venta anulada")
+    if status == 'CANCELLED':
+        raise ValidationError("Para anular la venta utilice la opción Cancelar Venta")
+    check_transition(sale, status)
+    wanted = merge_cart(clean_cart(cart))
+
+    existing = {}
+    to_delete = []
+    for detail in sale.saledetail_set.all():
+        if detail.product_id in existing:
+            # Líneas repetidas del mismo producto se consolidan en una sola
+            to_delete.append(detail)
+        else:
+            existing[detail.product_id] = detail
+
+    # Aporte al resumen diario antes de la edición (se descuenta al final)
+    rollup_changes = {}
+    if sale.status == 'COMPLETED':
+        DailySalesRollup.objects.contributions(
+            sale, list(existing.values()) + to_delete, sign=-1, changes=rollup_changes
+        )
+
+    # Stock descontado antes y después de la edición
+    is_stock_deducted = sale.is_stock_deducted or status == 'COMPLETED'
+    old_quantities = {}
+    if sale.is_stock_deducted:
+        for detail in list(existing.values()) + to_delete:
+            old_quantities[detail.product_id] = old_quantities.get(detail.product_id, 0) + detail.quantity
+    new_quantities = {}
+    if is_stock_deducted:
+        new_quantities = {product_id: item['quantity'] for product_id, item in wanted.items()}
+
+    deltas = {}
+    for product_id in set(old_quantities) | set(new_quantities):
+        delta = new_quantities.get(product_id, 0) - old_quantities.get(product_id, 0)
+        if delta:
+            deltas[product_id] = delta
+
+    new_product_ids = set(wanted) - set(existing)
+    products = lock_products(set(deltas) | new_product_ids)
+    missing = new_product_ids - set(products)
+    if missing:
+        raise ValidationError("Uno o más productos no existen")
+
+    increases = {product_id: delta for product_id, delta in deltas.items() if delta > 0}
+    shortages = find_shortages(products, increases)
+    if shortages:
+        raise InsufficientStockError(shortages)
+    deduct_stock(deltas)
+    StockMovement.objects.record(negate(deltas), 'EDIT', sale=sale)
+
+    to_update = []
+    for product_id, detail in existing.items():
+        item = wanted.get(product_id)
+        if item is None:
+            to_delete.append(detail)
+        elif item['quantity'] != detail.quantity or item['price'] != detail.unit_price:
+            detail.quantity = item['quantity']
+            detail.unit_price = item['price']
+            detail.take_snapshot()
+            to_update.append(detail)
+
+    to_create = build_details(sale, [
+        {'product_id': product_id, 'quantity': wanted[product_id]['quantity'], 'price': wanted[product_id]['price']}
+        for product_id in new_product_ids
+    ], products)
+
+    if to_delete:
+        SaleDetail.objects.filter(pk__in=[detail.pk for detail in to_delete]).delete()
+    if to_update:
+        SaleDetail.objects.bulk_update(
+            to_update, ['quantity', 'unit_price', 'subtotal', 'net_unit_cost', 'net_profit']
+        )
+    if to_create:
+        SaleDetail.objects.bulk_create(to_create)
+
+    deleted_ids = {detail.pk for detail in to_delete}
+    details = [detail for detail in existing.values() if detail.pk not in deleted_ids] + to_create
+    sale.apply_summary(details)
+    sale.payment_method = payment_method
+    sale.status = status
+    sale.clean_fields()
+    sale.clean()
+    if status == 'COMPLETED':
+        DailySalesRollup.objects.contributions(sale, details, changes=rollup_changes)
+    DailySalesRollup.objects.apply(rollup_changes)
+    return compare_and_swap(
+        sale,
+        payment_method=payment_method,
+        status=status,
+        is_stock_deducted=is_stock_deducted,
+        is_modified=True,
+        **{field: getattr(sale, field) for field in Sale.SUMMARY_FIELDS},
+    )
+
+
+@retry_on_conflict
+def change_payment_method(sale_id, payment_method):
+    """Cambia sólo el medio de pago de una venta con compare-and-swap sobre su versión.
+
+    Si la venta está completada, su aporte al resumen diario pasa del
+    medio de pago anterior al nuevo.
+    """
+    if payment_method not in dict(Sale.PAYMENT_CHOICES):
+        raise ValidationError("Método de pago inválido")
+    sale = Sale.objects.get(pk=sale_id)
+    if sale.payment_method == payment_method:
+        return sale
+    completed = sale.status == 'COMPLETED'
+    rollup_changes = {}
+    if completed:
+        details = list(sale.saledetail_set.all())
+        DailySalesRollup.objects.contributions(sale, details, sign=-1, changes=rollup_changes)
+    compare_and_swap(sale, payment_method=payment_method, is_modified=True)
+    if completed:
+        DailySalesRollup.objects.contributions(sale, details, changes=rollup_changes)
+        DailySalesRollup.objects.apply(rollup_changes)
+    return sale
+
+
+@retry_on_conflict
+def transition_sale(sale_id, new_status):
+    """Cambia el estado de una venta aplicando su efecto en el stock exactamente una vez.
+
+    El cambio de estado se reclama con compare-and-swap sobre la versión
+    antes de tocar el stock: de dos solicitudes simultáneas sólo una
+    gana, y la otra se reintenta sobre el estado ya actualizado.
+    """
+    sale = Sale.objects.get(pk=sale_id)
+    if new_status == sale.status:
+        return sale
+    check_transition(sale, new_status)
+
+    deduct = new_status == 'COMPLETED' and not sale.is_stock_deducted
+    restore = new_status == 'CANCELLED' and sale.is_stock_deducted
+    # El resumen diario sólo cuenta ventas completadas
+    rollup_sign = (new_status == 'COMPLETED') - (sale.status == 'COMPLETED')
+    compare_and_swap(
+        sale,
+        status=new_status,
+        is_stock_deducted=(sale.is_stock_deducted or deduct) and not restore,
+    )
+
+    if deduct or restore or rollup_sign:
+        details = list(sale.saledetail_set.all())
+        quantities = aggregate_quantities(
+            {'product_id': detail.product_id, 'quantity': detail.quantity} for detail in details
+        )
+        if deduct:
+            deduct_stock(quantities)
+            StockMovement.objects.record(negate(quantities), 'SALE', sale=sale)
+        elif restore:
+            restore_stock(quantities)
+            StockMovement.objects.record(quantities, 'CANCEL', sale=sale)
+        if rollup_sign:
+            DailySalesRollup.objects.apply(
+                DailySalesRollup.objects.contributions(sale, details, sign=rollup_sign)
+            )
+    return sale
+
+
+@retry_on_conflict
+def settle_sales(sale_ids):
+    """Marca como completadas varias ventas pendientes en una sola transacción.
+
+    Suma por producto las cantidades requeridas por todas las ventas,
+    valida el stock con una sola consulta, lo descuenta con un único
+    UPDATE y cambia el estado de todas las ventas con otro. Las ventas se
+    atienden por orden de fecha; las que no alcanzan stock quedan
+    pendientes y se informan en ``failed`` junto con el motivo.
+    """
+    sale_ids = {int(sale_id) for sale_id in sale_ids}
+    sales = list(Sale.objects.select_for_update().filter(pk__in=sale_ids).order_by('date', 'pk'))
+
+    failed = [
+        {'id': sale_id, 'number': None, 'reason': "La venta no existe"}
+        for sale_id in sorted(sale_ids - {sale.pk for sale in sales})
+    ]
+    pending = []
+    for sale in sales:
+        if sale.status != 'PENDING':
+            failed.append({'id': sale.pk, 'number': sale.number, 'reason': "La venta no está pendiente"})
+        elif sale.total == 0:
+            failed.append({'id': sale.pk, 'number': sale.number, 'reason': "No se puede completar una venta sin productos"})
+        else:
+            pending.append(sale)
+
+    required = {}
+    rows = SaleDetail.objects.filter(
+        sale__in=[sale for sale in pending if not sale.is_stock_deducted]
+    ).values('sale_id', 'product_id').annotate(quantity=Sum('quantity'))
+    for row in rows:
+        required.setdefault(row['sale_id'], {})[row['product_id']] = row['quantity']
+
+    products = lock_products({product_id for needs in required.values() for product_id in needs})
+    available = {product_id: product.stock for product_id, product in products.items()}
+
+    totals = {}
+    settled = []
+    for sale in pending:
+        needs = required.get(sale.pk, {})
+        shortages = [product_id for product_id, quantity in needs.items() if available.get(product_id, 0) < quantity]
+        if shortages:
+            names = ', '.join(products[product_id].name if product_id in products else f'#{product_id}' for product_id in shortages)
+            failed.append({'id': sale.pk, 'number': sale.number, 'reason': f"Stock insuficiente para {names}"})
+            continue
+        for product_id, quantity in needs.items():
+            available[product_id] -= quantity
+            totals[product_id] = totals.get(product_id, 0) + quantity
+        settled.append(sale)
+
+    if settled:
+        claimed = Q()
+        for sale in settled:
+            claimed |= Q(pk=sale.pk, version=sale.version)
+        updated = Sale.objects.filter(claimed).update(
+            status='COMPLETED', is_stock_deducted=True,
+            version=F('version') + 1, updated=timezone.now()
+        )
+        if updated != len(settled):
+            raise SaleConflictError([sale.pk for sale in settled])
+    deduct_stock(totals)
+    movements = []
+    for sale in settled:
+        sale.status = 'COMPLETED'
+        sale.is_stock_deducted = True
+        sale.version += 1
+        movements += StockMovement.objects.build(negate(required.get(sale.pk, {})), 'SALE', sale=sale)
+    StockMovement.objects.bulk_create(movements)
+
+    if settled:
+        details = {}
+        for detail in SaleDetail.objects.filter(sale__in=settled):
+            details.setdefault(detail.sale_id, []).append(detail)
+        rollup_changes = {}
+        for sale in settled:
+            DailySalesRollup.objects.contributions(sale, details.get(sale.pk, []), changes=rollup_changes)
+        DailySalesRollup.objects.apply(rollup_changes)
+    return settled, failed
@@ -1,3 +1,558 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from core.dates import period_days, start_of_day
+from core.pagination import encode_cursor
+from core.testing import LOCMEM_CACHES
+from products.models import Category, Product, StockMovement
+from . import services
+from .models import DailySalesRollup, Sale, SaleDetail, SaleNumberBlock, SaleNumberCounter, format_sale_number
+from .services import (
+    InsufficientStockError, SaleConflictError, change_payment_method, checkout, compare_and_swap,
+    deduct_stock, edit_sale, settle_sales, transition_sale,
+)
 
-# Create your tests here.
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DateRangeQueryPlanTests(TestCase):
+    """Los filtros por período deben resolverse con los índices compuestos.
+
+    Se siembran ventas repartidas en dos años y se revisa el plan de
+    ejecución (EXPLAIN QUERY PLAN en SQLite, EXPLAIN en PostgreSQL).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user('vendedor', password='clave')
+        category = Category.objects.create(name='General')
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Producto {index}', brand='Marca', category=category,
+                purchase_price=500, sale_price=1000, stock=100
+            )
+            for index in range(20)
+        ])
+
+        now = timezone.now()
+        statuses = ['COMPLETED', 'COMPLETED', 'PENDING', 'CANCELLED']
+        sales = Sale.objects.bulk_create([
+            Sale(
+                number=format_sale_number(index + 1), user=user, payment_method='CASH',
+                status=statuses[index % len(statuses)], total=1000
+            )
+            for index in range(2000)
+        ])
+        # auto_now_add fija la fecha al insertar; se reparten hacia atrás
+        for index, sale in enumerate(sales):
+            sale.date = now - timedelta(hours=9 * index)
+        Sale.objects.bulk_update(sales, ['date'], batch_size=500)
+
+        SaleDetail.objects.bulk_create([
+            SaleDetail(
+                sale=sale, product=products[(index + offset) % len(products)],
+                quantity=1, unit_price=1000, purchase_price=500, subtotal=1000
+            )
+            for index, sale in enumerate(sales)
+            for offset in range(2)
+        ])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Con pocas filas el planificador prefiere recorrer la tabla;
+                # aquí sólo interesa que el filtro sea utilizable por el índice
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def period_range(self, period):
+        """Período del dashboard como rango semiabierto de fecha y hora"""
+        start, end = period_days()[period]
+        return start_of_day(start), start_of_day(end)
+
+    def test_period_totals_use_status_date_index(self):
+        start, end = self.period_range('month')
+        queryset = Sale.objects.filter(
+            status='COMPLETED', date__gte=start, date__lt=end
+        ).values('status').annotate(total=Sum('total'))
+        self.assertIn('sale_status_date_idx', self.explain(queryset))
+
+    def test_top_products_use_composite_indexes(self):
+        start, end = self.period_range('week')
+        queryset = SaleDetail.objects.filter(
+            sale__status='COMPLETED', sale__date__gte=start, sale__date__lt=end
+        ).values('product').annotate(total_quantity=Sum('quantity'))
+        plan = self.explain(queryset)
+        self.assertIn('sale_status_date_idx', plan)
+        self.assertIn('saledetail_sale_product_idx', plan)
+
+    def test_day_filter_is_half_open(self):
+        sale = Sale.objects.order_by('-date')[500]
+        day = timezone.localdate(sale.date)
+        start, end = start_of_day(day), start_of_day(day + timedelta(days=1))
+        self.assertLessEqual(start, sale.date)
+        self.assertLess(sale.date, end)
+        self.assertEqual(end - start, timedelta(days=1))
+        self.assertIn(sale, Sale.objects.filter(date__gte=start, date__lt=end))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DailySalesRollupTests(TestCase):
+    """El resumen mantenido en cada operación debe coincidir con uno recalculado"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('cajero', password='clave')
+        category = Category.objects.create(name='General')
+        cls.products = [
+            Product.objects.create(
+                name=f'Producto {index}', brand='Marca', category=category,
+                purchase_price=400 + index, sale_price=1000, stock=100,
+                is_sale_with_tax=bool(index % 2)
+            )
+            for index in range(3)
+        ]
+
+    def cart(self, *lines):
+        return [
+            {'product_id': self.products[index].pk, 'quantity': quantity, 'price': 1000 + index}
+            for index, quantity in lines
+        ]
+
+    def snapshot(self):
+        return sorted(DailySalesRollup.objects.values_list(
+            'day', 'product_id', 'payment_method', 'user_id', *DailySalesRollup.ROLLUP_FIELDS
+        ))
+
+    def test_incremental_rollup_matches_rebuild(self):
+        first = checkout(self.cart((0, 2), (1, 3)), self.user, 'CASH', 'COMPLETED')
+        second = checkout(self.cart((1, 1), (2, 4)), self.user, 'DEBIT', 'COMPLETED')
+        pending = checkout(self.cart((2, 5)), self.user, 'CASH', 'PENDING')
+        later = checkout(self.cart((0, 1)), self.user, 'CASH', 'PENDING')
+
+        edit_sale(first, self.cart((0, 5), (2, 1)), 'TRANSFER', 'COMPLETED')
+        change_payment_method(first.pk, 'CREDIT')
+        transition_sale(second.pk, 'CANCELLED')
+        settle_sales([pending.pk])
+        transition_sale(later.pk, 'COMPLETED')
+        transition_sale(later.pk, 'PENDING')
+
+        incremental = self.snapshot()
+        self.assertTrue(incremental)
+        today = timezone.localdate()
+        DailySalesRollup.objects.rebuild(today - timedelta(days=1), today + timedelta(days=1))
+        self.assertEqual(incremental, self.snapshot())
+
+        completed = Sale.objects.filter(status='COMPLETED').aggregate(total=Sum('total'))['total']
+        self.assertEqual(DailySalesRollup.objects.aggregate(total=Sum('gross'))['total'], completed)
+
+
+class SaleTestData:
+    """Cajero y productos comunes a las pruebas del punto de venta"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('cajero', 'cajero@example.com', 'clave', role='admin')
+        category = Category.objects.create(name='General')
+        cls.products = [
+            Product.objects.create(
+                name=f'Producto {index}', brand='Marca', category=category,
+                purchase_price=400, sale_price=1000, stock=10,
+            )
+            for index in range(3)
+        ]
+
+    def cart(self, *lines, price=1000):
+        return [
+            {'product_id': self.products[index].pk, 'quantity': quantity, 'price': price}
+            for index, quantity in lines
+        ]
+
+    def stock(self, index):
+        return Product.objects.get(pk=self.products[index].pk).stock
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CheckoutTests(SaleTestData, TestCase):
+    """El checkout descuenta el stock una sola vez y nunca lo deja negativo"""
+
+    def test_checkout_records_sale_and_stock(self):
+        sale = checkout(self.cart((0, 2), (1, 3), (0, 1)), self.user, 'CASH', 'COMPLETED')
+        self.assertEqual((self.stock(0), self.stock(1), self.stock(2)), (7, 7, 10))
+        self.assertEqual((sale.total, sale.item_count, sale.units_total), (6000, 3, 6))
+        self.assertTrue(sale.is_stock_deducted)
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(sale=sale).values_list('product_id', 'quantity')),
+            [(self.products[0].pk, -3), (self.products[1].pk, -3)],
+        )
+        self.assertEqual(DailySalesRollup.objects.aggregate(total=Sum('gross'))['total'], 6000)
+
+    def test_invalid_lines_are_rejected(self):
+        carts = [
+            self.cart((0, -2), (1, 5)),
+            self.cart((0, 0), (1, 1)),
+            self.cart((0, 1), price=-1000),
+            [{'product_id': self.products[0].pk}],
+            'no es un carrito',
+        ]
+        for cart in carts:
+            with self.subTest(cart=cart), self.assertRaises(ValidationError):
+                checkout(cart, self.user, 'CASH', 'COMPLETED')
+        self.assertEqual(self.stock(1), 10)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_shortages_are_reported_together(self):
+        with self.assertRaises(InsufficientStockError) as raised:
+            checkout(self.cart((0, 11), (1, 2), (2, 20)), self.user, 'CASH', 'COMPLETED')
+        self.assertEqual(
+            [(item['product_id'], item['available']) for item in raised.exception.shortages],
+            [(self.products[0].pk, 10), (self.products[2].pk, 10)],
+        )
+        self.assertEqual(self.stock(1), 10)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_last_units_go_to_one_sale(self):
+        checkout(self.cart((0, 6)), self.user, 'CASH', 'COMPLETED')
+        with self.assertRaises(InsufficientStockError):
+            checkout(self.cart((0, 6)), self.user, 'CASH', 'COMPLETED')
+        self.assertEqual(self.stock(0), 4)
+        # El UPDATE condicional también protege si el stock cambió tras leerlo
+        with self.assertRaises(InsufficientStockError):
+            deduct_stock({self.products[0].pk: 5})
+        self.assertEqual(self.stock(0), 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@skipUnless(connection.vendor == 'postgresql', "Requiere bloqueos de filas entre conexiones")
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Varias cajas vendiendo el mismo producto a la vez no dejan stock negativo"""
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        user = get_user_model().objects.create_user('cajero', password='clave')
+        category = Category.objects.create(name='General')
+        product = Product.objects.create(
+            name='Producto', brand='Marca', category=category,
+            purchase_price=400, sale_price=1000, stock=10,
+        )
+        barrier = threading.Barrier(5)
+        results = []
+
+        def sell():
+            try:
+                barrier.wait()
+                checkout([{'product_id': product.pk, 'quantity': 3, 'price': 1000}], user, 'CASH', 'COMPLETED')
+                results.append(True)
+            except InsufficientStockError:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sell) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False, False, True, True, True])
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 1)
+        self.assertEqual(Sale.objects.values('number').distinct().count(), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SaleNumberTests(TestCase):
+    """Los números de venta se reservan por bloques sin repetirse"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user('cajero', password='clave')
+        Sale.objects.create(number=format_sale_number(7), user=user, payment_method='CASH', status='PENDING')
+        # Sin contador, la primera reserva parte desde la última venta existente
+        SaleNumberCounter.objects.all().delete()
+
+    def take(self, block):
+        """Toma un número y confirma la transacción, como lo haría una venta"""
+        with self.captureOnCommitCallbacks(execute=True):
+            return block.take()
+
+    @override_settings(SALE_NUMBER_BLOCK_SIZE=5)
+    def test_block_allocation(self):
+        block = SaleNumberBlock()
+        self.assertEqual([self.take(block) for _ in range(6)], [8, 9, 10, 11, 12, 13])
+        self.assertEqual(SaleNumberCounter.objects.get(name='sale').last_value, 17)
+
+        # Otro worker recibe su propio bloque a continuación
+        other = SaleNumberBlock()
+        self.assertEqual(self.take(other), 18)
+        self.assertEqual(self.take(block), 14)
+        self.assertEqual(SaleNumberCounter.objects.get(name='sale').last_value, 22)
+
+    @override_settings(SALE_NUMBER_BLOCK_SIZE=5)
+    def test_rolled_back_block_is_discarded(self):
+        block = SaleNumberBlock()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.assertEqual(block.take(), 8)
+            raise IntegrityError
+        # La reserva se revirtió junto con la venta: el bloque no queda en memoria
+        self.assertFalse(SaleNumberCounter.objects.exists())
+        self.assertEqual(self.take(block), 8)
+        self.assertEqual(self.take(block), 9)
+        self.assertEqual(SaleNumberCounter.objects.get(name='sale').last_value, 12)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SettleSalesTests(SaleTestData, TestCase):
+    """El cierre en lote completa lo que puede e informa el resto"""
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_partial_failures_are_reported(self):
+        ready = checkout(self.cart((0, 2)), self.user, 'TRANSFER', 'PENDING')
+        # Venta pendiente antigua, registrada sin descontar stock
+        short = checkout(self.cart((1, 8)), self.user, 'TRANSFER', 'PENDING')
+        Sale.objects.filter(pk=short.pk).update(is_stock_deducted=False)
+        Product.objects.filter(pk=self.products[1].pk).update(stock=5)
+        completed = checkout(self.cart((2, 1)), self.user, 'CASH', 'COMPLETED')
+
+        settled, failed = settle_sales([ready.pk, short.pk, completed.pk, 0])
+        self.assertEqual([sale.pk for sale in settled], [ready.pk])
+        self.assertEqual(
+            sorted((item['id'], item['reason']) for item in failed),
+            [
+                (0, "La venta no existe"),
+                (short.pk, "Stock insuficiente para Producto 1"),
+                (completed.pk, "La venta no está pendiente"),
+            ],
+        )
+        statuses = dict(Sale.objects.values_list('pk', 'status'))
+        self.assertEqual((statuses[ready.pk], statuses[short.pk]), ('COMPLETED', 'PENDING'))
+        self.assertEqual((self.stock(0), self.stock(1)), (8, 5))
+
+    def test_view_reports_errors(self):
+        url = reverse('sales:bulk_settle')
+        sale = checkout(self.cart((0, 1)), self.user, 'TRANSFER', 'PENDING')
+        response = self.client.post(url, json.dumps({'sale_ids': [sale.pk]}), content_type='application/json')
+        self.assertEqual(response.json()['settled'], [{'id': sale.pk, 'number': sale.number}])
+
+        response = self.client.post(url, json.dumps(['no es un objeto']), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        conflict = ValidationError("La venta fue modificada por otra operación, intente nuevamente")
+        with mock.patch('sales.views.settle_sales', side_effect=conflict):
+            response = self.client.post(url, {'sale_ids': [sale.pk]})
+        self.assertEqual(response.status_code, 409)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SaleConflictTests(SaleTestData, TestCase):
+    """Las escrituras sobre una venta se hacen con compare-and-swap y se reintentan"""
+
+    def setUp(self):
+        self.sale = checkout(self.cart((0, 2)), self.user, 'CASH', 'PENDING')
+
+    def interfere(self, times):
+        """Simula otra operación que modifica la venta justo antes de las primeras ``times`` escrituras"""
+        calls = []
+
+        def wrapper(sale, **fields):
+            calls.append(sale.pk)
+            if len(calls) <= times:
+                Sale.objects.filter(pk=sale.pk).update(version=F('version') + 1)
+            return compare_and_swap(sale, **fields)
+        return mock.patch.object(services, 'compare_and_swap', side_effect=wrapper), calls
+
+    def test_stale_version_is_rejected(self):
+        stale = Sale.objects.get(pk=self.sale.pk)
+        compare_and_swap(self.sale, payment_method='DEBIT')
+        with self.assertRaises(SaleConflictError):
+            compare_and_swap(stale, payment_method='TRANSFER')
+        self.sale.refresh_from_db()
+        self.assertEqual((self.sale.payment_method, self.sale.version), ('DEBIT', 1))
+
+    def test_conflict_is_retried(self):
+        patch, calls = self.interfere(1)
+        with patch:
+            transition_sale(self.sale.pk, 'COMPLETED')
+        self.assertEqual(len(calls), 2)
+        self.sale.refresh_from_db()
+        # El intento fallido se revierte completo, incluida la escritura simulada
+        self.assertEqual((self.sale.status, self.sale.version), ('COMPLETED', 1))
+        self.assertEqual(self.stock(0), 8)
+
+    def test_persistent_conflict_is_a_validation_error(self):
+        patch, calls = self.interfere(services.MAX_CONFLICT_RETRIES)
+        with patch, self.assertRaises(ValidationError):
+            transition_sale(self.sale.pk, 'CANCELLED')
+        self.assertEqual(len(calls), services.MAX_CONFLICT_RETRIES)
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.status, 'PENDING')
+        self.assertEqual(self.stock(0), 8)
+
+    def test_edit_sale_validates_lines(self):
+        with self.assertRaises(ValidationError):
+            edit_sale(self.sale, self.cart((0, -1)), 'CASH', 'PENDING')
+        edit_sale(self.sale, self.cart((0, 1), (1, 4)), 'DEBIT', 'PENDING')
+        self.sale.refresh_from_db()
+        self.assertEqual((self.sale.total, self.sale.version, self.stock(0), self.stock(1)), (5000, 1, 9, 6))
+
+    def test_payment_change_keeps_status_and_stock_flag(self):
+        with self.assertRaises(ValidationError):
+            change_payment_method(self.sale.pk, 'CHEQUE')
+        Sale.objects.filter(pk=self.sale.pk).update(status='COMPLETED')
+        change_payment_method(self.sale.pk, 'TRANSFER')
+        self.sale.refresh_from_db()
+        self.assertEqual(
+            (self.sale.payment_method, self.sale.status, self.sale.is_stock_deducted, self.sale.version),
+            ('TRANSFER', 'COMPLETED', True, 1),
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SaleEditTests(SaleTestData, TestCase):
+    """Las ventas sólo se editan a través de los servicios, nunca con un save() completo"""
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.sale = checkout(self.cart((0, 2), (1, 1)), self.user, 'CASH', 'COMPLETED')
+
+    def test_edit_view_requires_json(self):
+        url = reverse('sales:edit', args=[self.sale.pk])
+        response = self.client.post(url, {'payment_method': 'DEBIT', 'status': 'CANCELLED'})
+        self.assertEqual(response.status_code, 415)
+        response = self.client.post(
+            url, json.dumps({'cart': self.cart((0, -2)), 'payment_method': 'CASH', 'status': 'COMPLETED'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, json.dumps(['no es un objeto']), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.sale.refresh_from_db()
+        self.assertEqual((self.sale.status, self.sale.version, self.stock(0)), ('COMPLETED', 0, 8))
+
+    def test_admin_only_changes_payment_method(self):
+        details = list(self.sale.saledetail_set.order_by('pk'))
+        data = {
+            'payment_method': 'DEBIT', 'initial-payment_method': 'CASH', '_save': 'Guardar',
+            'saledetail_set-TOTAL_FORMS': len(details), 'saledetail_set-INITIAL_FORMS': len(details),
+            'saledetail_set-MIN_NUM_FORMS': 0, 'saledetail_set-MAX_NUM_FORMS': 1000,
+        }
+        for index, detail in enumerate(details):
+            data.update({
+                f'saledetail_set-{index}-id': detail.pk,
+                f'saledetail_set-{index}-sale': self.sale.pk,
+                # Campos de sólo lectura: el admin debe ignorarlos
+                f'saledetail_set-{index}-is_purchase_with_tax': '',
+                f'saledetail_set-{index}-net_unit_cost': 0,
+            })
+        # Otra operación cambia el estado mientras el formulario estaba abierto
+        transition_sale(self.sale.pk, 'PENDING')
+        response = self.client.post(reverse('admin:sales_sale_change', args=[self.sale.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        self.sale.refresh_from_db()
+        self.assertEqual(
+            (self.sale.payment_method, self.sale.status, self.sale.is_stock_deducted, self.sale.version),
+            ('DEBIT', 'PENDING', True, 2),
+        )
+        self.assertEqual(
+            list(self.sale.saledetail_set.order_by('pk').values_list('is_purchase_with_tax', 'net_unit_cost')),
+            [(detail.is_purchase_with_tax, detail.net_unit_cost) for detail in details],
+        )
+
+        transition_sale(self.sale.pk, 'COMPLETED')
+        self.assertEqual(list(DailySalesRollup.objects.values_list('payment_method', flat=True).distinct()), ['DEBIT'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartBatchApiTests(SaleTestData, TestCase):
+    """Operaciones del carrito en lote, como las envía el lector de códigos"""
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def batch(self, data):
+        return self.client.post(reverse('sales:cart_batch'), json.dumps(data), content_type='application/json')
+
+    def test_cart_batch_applies_all_operations(self):
+        first, second = self.products[0].pk, self.products[1].pk
+        response = self.batch({'operations': [
+            {'op': 'add', 'product_id': first, 'quantity': 2},
+            {'op': 'add', 'product_id': second},
+            {'op': 'add', 'product_id': first, 'quantity': 3},
+            {'op': 'remove', 'product_id': second},
+        ]})
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item['product_id'], item['quantity']) for item in data['changed']], [(first, 5)])
+        self.assertEqual((data['removed'], data['count'], data['total']), ([second], 1, 5000))
+
+        response = self.batch({'operations': [{'op': 'update', 'product_id': first, 'quantity': 1}]})
+        self.assertEqual(response.json()['total'], 1000)
+
+    def test_cart_batch_rejects_invalid_operations(self):
+        first = self.products[0].pk
+        self.batch({'operations': [{'op': 'add', 'product_id': first, 'quantity': 4}]})
+        for data in (
+            ['no es un objeto'],
+            {'operations': {'op': 'add'}},
+            {'operations': [{'op': 'add', 'product_id': 'x'}]},
+            {'operations': [{'op': 'add', 'product_id': first, 'quantity': -3}]},
+            {'operations': [{'op': 'add', 'product_id': first, 'quantity': 7}]},
+            {'operations': [{'op': 'update', 'product_id': first, 'quantity': 2}, {'op': 'vender', 'product_id': first}]},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.batch(data).status_code, 400)
+        # Nada se aplicó: el carrito sigue con las 4 unidades iniciales
+        response = self.batch({'operations': [{'op': 'add', 'product_id': first, 'quantity': 1}]})
+        self.assertEqual(response.json()['changed'][0]['quantity'], 5)
+
+    def test_cart_survives_login(self):
+        first = self.products[0].pk
+        self.batch({'operations': [{'op': 'add', 'product_id': first, 'quantity': 2}]})
+        # login() rota la clave de la sesión; el carrito debe conservarse
+        session = self.client.session
+        session.cycle_key()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        response = self.batch({'operations': [{'op': 'add', 'product_id': first}]})
+        self.assertEqual(response.json()['changed'][0]['quantity'], 3)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.batch({'operations': []}).status_code, 302)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductCatalogApiTests(SaleTestData, TestCase):
+    """Catálogo del selector de productos, paginado por cursor"""
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_catalog_pages_with_cursor(self):
+        url = reverse('sales:list_products')
+        first = self.client.get(url, {'limit': 2}).json()
+        self.assertEqual([row['name'] for row in first['results']], ['Producto 0', 'Producto 1'])
+        second = self.client.get(url, {'limit': 2, 'cursor': first['next']}).json()
+        self.assertEqual([row['name'] for row in second['results']], ['Producto 2'])
+        self.assertIsNone(second['next'])
+
+        # Un cursor alterado se trata como ausente
+        for values in (['Producto 0', 'no es un id'], [['x'], {'y': 1}], ['Producto 0'], 'texto'):
+            with self.subTest(values=values):
+                response = self.client.get(url, {'limit': 2, 'cursor': encode_cursor(values)})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['results'], first['results'])
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('sales:list_products')).status_code, 302)
@@ -10,13 +10,18 @@ urlpatterns = [
     path('create/', views.SaleCreateView.as_view(), name='create'),
     path('detail/<int:pk>/', views.SaleDetailView.as_view(), name='detail'),
     path('update-status/<int:pk>/', views.SaleUpdateStatusView.as_view(), name='update_status'),
+    path('settle/', views.SaleBulkSettleView.as_view(), name='bulk_settle'),
+    path('export/', views.SaleExportView.as_view(), name='export'),
     path('sales/cancel/<int:pk>/confirm/', views.SaleCancelConfirmationView.as_view(), name='cancel_confirmation'),
     path('edit/<int:pk>/', views.SaleEditView.as_view(), name='edit'),
 
     
+    path('api/products/', api.list_products, name='list_products'),
     path('api/products/search/', api.search_products, name='search_products'),
+    path('api/products/scan/', api.scan_product, name='scan_product'),
     path('api/cart/add/', api.add_to_cart, name='add_to_cart'),
     path('api/cart/update/', api.update_cart, name='update_cart'),
     path('api/cart/remove/<int:product_id>/', api.remove_from_cart, name='remove_from_cart'),
     path('api/cart/init/', api.init_cart, name='init_cart'),
+    path('api/cart/batch/', api.cart_batch, name='cart_batch'),
 ]
\ No newline at end of file
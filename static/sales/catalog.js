@@ -0,0 +1,85 @@
+// Filas de productos para la búsqueda y el catálogo de las pantallas de venta.
+// Los datos del producto se escriben con textContent para no interpretarlos como HTML.
+(function() {
+    const script = document.currentScript;
+    let catalogCursor = null;
+
+    function cell(className, ...children) {
+        const td = document.createElement('td');
+        td.className = className;
+        children.forEach(child => td.append(child));
+        return td;
+    }
+
+    function text(tag, className, value) {
+        const element = document.createElement(tag);
+        element.className = className;
+        element.textContent = value;
+        return element;
+    }
+
+    window.productRow = function(product) {
+        const button = text('button', 'text-blue-600 hover:text-blue-900', 'Agregar');
+        button.type = 'button';
+        button.addEventListener('click', () => window.addToCart(product));
+
+        const row = document.createElement('tr');
+        row.append(
+            cell('px-6 py-4 whitespace-nowrap',
+                text('div', 'text-sm font-medium text-gray-900', product.name),
+                text('div', 'text-sm text-gray-500', product.brand || '')),
+            cell('px-6 py-4 whitespace-nowrap text-sm text-gray-500', String(product.stock)),
+            cell('px-6 py-4 whitespace-nowrap text-sm text-gray-500', `$ ${product.sale_price.toLocaleString()}`),
+            cell('px-6 py-4 whitespace-nowrap text-right text-sm font-medium', button),
+        );
+        return row;
+    };
+
+    window.escapeHtml = function(value) {
+        const element = document.createElement('span');
+        element.textContent = value;
+        return element.innerHTML;
+    };
+
+    window.messageRow = function(message) {
+        const row = document.createElement('tr');
+        const td = cell('px-6 py-4 text-center text-gray-500', message);
+        td.colSpan = 4;
+        row.append(td);
+        return row;
+    };
+
+    // Catálogo paginado: se carga por páginas sólo cuando se solicita
+    window.loadCatalog = async function(append = false) {
+        const searchResults = document.getElementById('searchResults');
+        const searchResultsBody = document.getElementById('searchResultsBody');
+        try {
+            const params = new URLSearchParams({ in_stock: script.dataset.inStock || '0' });
+            if (append && catalogCursor) params.set('cursor', catalogCursor);
+            const response = await fetch(`/sales/api/products/?${params}`);
+            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+            const data = await response.json();
+
+            const moreRow = document.getElementById('catalogMore');
+            if (moreRow) moreRow.remove();
+            if (!append) searchResultsBody.replaceChildren();
+
+            data.results.forEach(product => searchResultsBody.append(window.productRow(product)));
+            catalogCursor = data.next;
+            if (catalogCursor) {
+                const button = text('button', 'text-blue-600 hover:text-blue-900 text-sm', 'Cargar más');
+                button.type = 'button';
+                button.addEventListener('click', () => window.loadCatalog(true));
+                const td = cell('px-6 py-3 text-center', button);
+                td.colSpan = 4;
+                const row = document.createElement('tr');
+                row.id = 'catalogMore';
+                row.append(td);
+                searchResultsBody.append(row);
+            }
+            searchResults.classList.remove('hidden');
+        } catch (error) {
+            console.error('Error:', error);
+        }
+    };
+})();